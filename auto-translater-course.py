@@ -3,35 +3,347 @@ import os
 import sys
 import re
 import yaml  # pip install PyYAML
-import env
+try:
+    import env
+except ImportError:
+    # 没有 env.py 时直接使用环境变量，例如 GitHub Actions 中的 secrets
+    pass
 import argparse
 import asyncio
+import json
+import hashlib
+import time
 import shutil
+import random
+from types import SimpleNamespace
 from typing import List, Dict, Any
+import openai
 from openai import AsyncOpenAI
+from translation_cache import TranslationCache, make_cache_key
+from translation_manifest import TranslationManifest
+from chunk_journal import ChunkJournal
+from rate_limiter import TokenBucketRateLimiter
+from circuit_breaker import CircuitBreaker
+from concurrency_limiter import AdaptiveConcurrencyLimiter
+from backend_router import Backend, BackendRouter
+from run_metrics import RunMetrics
+from source_index import SKIPPED_PATH_PREFIXES, SourceIndex, scan_source_tree
+from source_watcher import SourceWatcher
+from token_estimator import estimate_tokens, chunk_token_budget
+from job_scheduler import order_longest_first, simulate_schedule, compare_schedule
+from replace_engine import ReplaceEngine
+from http_transport import create_http_client, current_http_timings
 from config import (
     SYSTEM_PROMPTS,
     MODEL_CONFIG,
-    MAX_LENGTH,
+    MODEL_TOKEN_LIMITS,
+    DEFAULT_MODEL_TOKEN_LIMITS,
+    OUTPUT_TOKEN_RATIO,
+    SCHEDULER_REQUEST_OVERHEAD_TOKENS,
+    MAX_CHUNK_TOKENS,
     MAX_CONCURRENT_FILES,
+    MAX_CONCURRENT_MEDIA,
+    DEFAULT_MEDIA_STRATEGY,
+    MAX_CONCURRENT_REQUESTS,
+    ADAPTIVE_CONCURRENCY,
+    ADAPTIVE_CONCURRENCY_MIN,
+    ADAPTIVE_CONCURRENCY_MAX,
+    ADAPTIVE_CONCURRENCY_DECREASE_FACTOR,
+    ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP2,
+    HTTP_TIMEOUTS,
+    RATE_LIMIT_RPM,
+    RATE_LIMIT_TPM,
+    MAX_RETRIES,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    RETRY_BUDGET_RATIO,
+    RETRY_BUDGET_MIN,
+    CIRCUIT_BREAKER_THRESHOLD,
+    CIRCUIT_BREAKER_COOLDOWN,
+    BACKENDS,
+    ROUTER_LATENCY_TARGETS,
+    ROUTER_LATENCY_WINDOW,
+    MODEL_PRICING,
+    METRICS_DIR,
+    BATCH_DIR,
+    BATCH_POLL_INTERVAL,
+    BATCH_MAX_REQUESTS,
+    FRONT_MATTER_BATCH_SIZE,
+    PHRASE_DICTIONARY,
     SUPPORTED_LANGUAGES,
     DEFAULT_DIR_TO_TRANSLATE,
     DEFAULT_EXCLUDE_LIST,
     DEFAULT_PROCESSED_LIST,
-    DIR_TRANSLATED
+    DEFAULT_MANIFEST,
+    SOURCE_INDEX_PATH,
+    CHUNK_JOURNAL_PATH,
+    WATCH_DEBOUNCE,
+    WATCH_POLL_INTERVAL,
+    MANIFEST_FLUSH_EVERY,
+    DIR_TRANSLATED,
+    TRANSLATION_CACHE_PATH,
+    TRANSLATION_CACHE_MAX_BYTES,
+    SNAPSHOT_DIR,
+    MARKER_FORCE_TRANSLATE
 )
 
-# 设置 OpenAI API Key 和 API Base 参数，通过 env.py 传入
-client = AsyncOpenAI(
-    api_key=os.environ.get("CHATGPT_API_KEY"),
-    base_url=os.environ.get("CHATGPT_API_BASE")
-)
+def create_client(api_key, base_url) -> AsyncOpenAI:
+    """创建 OpenAI 兼容的异步客户端，连接池大小与请求并发能达到的上限一致"""
+    max_connections = HTTP_MAX_CONNECTIONS or (ADAPTIVE_CONCURRENCY_MAX if ADAPTIVE_CONCURRENCY else MAX_CONCURRENT_REQUESTS)
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=create_http_client(max_connections, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY,
+                                       HTTP_TIMEOUTS, http2=HTTP2),
+        # 重试由 create_completion 统一处理，关闭 SDK 自带的重试，避免重复重试
+        max_retries=0
+    )
+
+# OpenAI API 客户端。API Key 和 API Base 通过 env.py 传入，也可以用命令行参数 --api-base/--api-key 覆盖，
+# 因此在 main_async 中解析命令行参数后才创建
+client = None
+
+# 翻译缓存，在 main_async 中根据命令行参数初始化，为 None 时不使用缓存
+translation_cache = None
+
+# 翻译清单，记录每个文件每种语言的翻译状态，在 main_async 中初始化
+manifest = None
+
+
+# 表示服务端过载、需要下调并发的错误
+OVERLOAD_STATUS_CODES = {429, 503}
+
+def is_overload_error(error: Exception) -> bool:
+    if isinstance(error, openai.APITimeoutError):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in OVERLOAD_STATUS_CODES
+
+def create_backend(name: str, client, models: Dict[str, str], pricing: Dict[str, Dict[str, float]] = None,
+                   rpm=None, tpm=None, max_concurrency: int = None) -> Backend:
+    """按 config.py 中的设置为一个后端创建限流器、熔断器和并发控制器。pricing 中没有列出的模型使用 MODEL_PRICING 中的价格"""
+    max_concurrency = max_concurrency or (ADAPTIVE_CONCURRENCY_MAX if ADAPTIVE_CONCURRENCY else MAX_CONCURRENT_REQUESTS)
+    return Backend(
+        name, client, models,
+        TokenBucketRateLimiter(rpm, tpm),
+        CircuitBreaker(CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN, name),
+        AdaptiveConcurrencyLimiter(
+            min(MAX_CONCURRENT_REQUESTS, max_concurrency), ADAPTIVE_CONCURRENCY_MIN, max_concurrency,
+            ADAPTIVE_CONCURRENCY_DECREASE_FACTOR, ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE, adaptive=ADAPTIVE_CONCURRENCY),
+        pricing={**MODEL_PRICING, **(pricing or {})},
+        latency_targets=ROUTER_LATENCY_TARGETS,
+        latency_window=ROUTER_LATENCY_WINDOW)
+
+def create_backends() -> List[Backend]:
+    """按 config.py 中的 BACKENDS 创建各后端，BACKENDS 为空时只使用 client（env.py 中的 API 地址）和 MODEL_CONFIG"""
+    if not BACKENDS:
+        return [create_backend("default", client, MODEL_CONFIG, rpm=RATE_LIMIT_RPM, tpm=RATE_LIMIT_TPM)]
+    backends = []
+    for config in BACKENDS:
+        max_concurrency = config.get("max_concurrency")
+        backend_client = AsyncOpenAI(
+            api_key=os.environ.get(config["api_key_env"]),
+            base_url=config["api_base"],
+            http_client=create_http_client(
+                HTTP_MAX_CONNECTIONS or max_concurrency or ADAPTIVE_CONCURRENCY_MAX, HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                HTTP_KEEPALIVE_EXPIRY, HTTP_TIMEOUTS, http2=HTTP2),
+            max_retries=0
+        )
+        backends.append(create_backend(config["name"], backend_client, config.get("models", MODEL_CONFIG),
+                                       config.get("pricing"), config.get("rpm"), config.get("tpm"), max_concurrency))
+    for type in MODEL_CONFIG:
+        if not any(type in backend.models for backend in backends):
+            raise ValueError(f"No backend in BACKENDS serves prompt type {type}")
+    return backends
+
+# 后端路由，所有 API 请求共用。在 main_async 中创建 client 后设置后端，指定了 --api-base/--api-key 时只使用单个后端
+backend_router = BackendRouter([])
+
+# 重试预算：整个运行期间允许的重试次数为 RETRY_BUDGET_MIN + 请求数 * RETRY_BUDGET_RATIO
+retry_stats = {"requests": 0, "retries": 0}
+
+# 可以重试的 HTTP 状态码
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+def is_retryable_error(error: Exception) -> bool:
+    """判断 API 错误是否为可重试的临时错误（限流、超时、连接失败、服务端错误）"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+def get_retry_delay(error: Exception, attempt: int) -> float:
+    """计算重试等待时间：优先使用服务端的 Retry-After，否则使用带完全抖动的指数退避"""
+    if isinstance(error, openai.APIStatusError):
+        retry_after = error.response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), RETRY_MAX_DELAY)
+            except ValueError:
+                pass
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+# 是否使用流式输出接收译文，在 main_async 中根据命令行参数设置
+stream_completions = False
+
+async def consume_stream(stream):
+    """逐段接收流式输出，拼接为与非流式响应结构相同的结果"""
+    parts = []
+    finish_reason = None
+    usage = None
+    async for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        if choice.delta is not None and choice.delta.content:
+            parts.append(choice.delta.content)
+        if choice.finish_reason is not None:
+            finish_reason = choice.finish_reason
+    message = SimpleNamespace(content="".join(parts))
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)], usage=usage)
+
+# 本次运行的指标，在 main_async 中初始化，为 None 时不记录
+run_metrics = None
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int, pricing=None) -> float:
+    """按每百万 token 的价格估算费用（美元），pricing 为 None 时使用 MODEL_PRICING 中的价格"""
+    pricing = pricing or MODEL_PRICING.get(model)
+    if pricing is None:
+        return 0.0
+    return ((prompt_tokens - cached_tokens) * pricing["input"]
+            + cached_tokens * pricing.get("cached_input", pricing["input"])
+            + completion_tokens * pricing["output"]) / 1_000_000
+
+def get_cached_tokens(usage) -> int:
+    """从响应的 usage 中读取命中服务端缓存的 prompt token 数，兼容 OpenAI 和 DeepSeek 的字段"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is not None and getattr(details, "cached_tokens", None):
+        return details.cached_tokens
+    return getattr(usage, "prompt_cache_hit_tokens", None) or 0
+
+async def create_completion(estimated_tokens: int, labels: Dict[str, str], **kwargs):
+    """调用 chat.completions.create，统一处理后端选择、限流、并发、熔断和重试，并记录本次调用的指标
+
+    labels 为记录指标用的标签，包含 type（提示词类型）和 lang（目标语言），指标类型与提示词类型不同时用 prompt_type
+    指明提示词类型。每次尝试都由 backend_router 选择后端，kwargs 中的 model 会替换为所选后端对应提示词类型的模型，
+    给出了 max_tokens 时按该模型的输出上限重新设置。请求失败且还有其他可用的后端时立即切换，不做退避等待。
+    返回 (响应, 实际使用的模型)，缓存键和翻译清单按实际使用的模型记录。
+    """
+    retry_stats["requests"] += 1
+    attempt = 0
+    queue_wait = 0.0
+    call_started_at = time.monotonic()
+    # HTTP 层的耗时（连接池等待、新建连接）由 http_transport 的 trace 回调写入
+    http_timings = {}
+    current_http_timings.set(http_timings)
+    prompt_type = labels.get("prompt_type", labels["type"])
+    # 本次调用中失败过的后端
+    failed_backends = set()
+    while True:
+        queued_at = time.monotonic()
+        backend = await backend_router.acquire(prompt_type, failed_backends)
+        kwargs["model"] = backend.models[prompt_type]
+        if "max_tokens" in kwargs:
+            kwargs["max_tokens"] = get_token_limits(kwargs["model"])["max_output"]
+        probing = await backend.circuit_breaker.wait_until_closed()
+        try:
+            await backend.rate_limiter.acquire(estimated_tokens)
+            dispatched_at = await backend.concurrency_limiter.acquire()
+            queue_wait += dispatched_at - queued_at
+            in_flight = backend.concurrency_limiter.in_flight
+            concurrency_limit = backend.concurrency_limiter.current_limit
+            try:
+                try:
+                    if kwargs.get("stream"):
+                        # 流式输出中途断开时，同样按可重试的错误处理
+                        stream = await backend.client.chat.completions.create(stream_options={"include_usage": True},
+                                                                              **kwargs)
+                        completion = await consume_stream(stream)
+                    else:
+                        completion = await backend.client.chat.completions.create(**kwargs)
+                    latency = time.monotonic() - dispatched_at
+                finally:
+                    backend.concurrency_limiter.release()
+            except Exception as e:
+                if is_overload_error(e):
+                    backend.concurrency_limiter.record_overload(dispatched_at)
+                retryable = is_retryable_error(e)
+                if retryable:
+                    backend.circuit_breaker.record_failure()
+                elif isinstance(e, openai.APIStatusError):
+                    # 服务端返回了不可重试的错误（如 400），说明后端本身可用
+                    backend.circuit_breaker.record_success()
+                retry_budget = RETRY_BUDGET_MIN + retry_stats["requests"] * RETRY_BUDGET_RATIO
+                if not retryable or attempt >= MAX_RETRIES or retry_stats["retries"] >= retry_budget:
+                    if run_metrics is not None:
+                        run_metrics.record(
+                            type=labels["type"], lang=labels["lang"], backend=backend.name, model=kwargs["model"], status="error",
+                            error=type(e).__name__, latency=time.monotonic() - dispatched_at,
+                            total_time=time.monotonic() - call_started_at, queue_wait=queue_wait,
+                            concurrency_limit=concurrency_limit,
+                            pool_wait=http_timings.get("pool_wait", 0.0), connect_time=http_timings.get("connect_time", 0.0),
+                            new_connection=http_timings.get("new_connection", False),
+                            prompt_tokens=0, completion_tokens=0, cached_tokens=0, cost=0.0, retries=attempt)
+                    raise
+                attempt += 1
+                retry_stats["retries"] += 1
+                failed_backends.add(backend)
+                if backend_router.has_alternative(prompt_type, failed_backends):
+                    print(f"Retrying request ({attempt}/{MAX_RETRIES}) on another backend after error from {backend.name}: {e}")
+                    sys.stdout.flush()
+                    continue
+                delay = get_retry_delay(e, attempt - 1)
+                print(f"Retrying request ({attempt}/{MAX_RETRIES}) in {delay:.1f}s after error from {backend.name}: {e}")
+                sys.stdout.flush()
+                await asyncio.sleep(delay)
+                continue
+        finally:
+            # 探测请求无论结果如何（包括不可重试的错误和取消）都要结束半开状态，否则之后的请求会一直等待
+            if probing:
+                backend.circuit_breaker.end_probe()
+
+        backend.circuit_breaker.record_success()
+        backend.record_latency(prompt_type, latency)
+        backend.concurrency_limiter.record_success(
+            labels["type"], dispatched_at, latency,
+            completion.usage.completion_tokens if completion.usage is not None else 0, in_flight)
+        if completion.usage is not None:
+            backend.rate_limiter.adjust(estimated_tokens, completion.usage.total_tokens)
+        if run_metrics is not None:
+            usage = completion.usage
+            prompt_tokens = usage.prompt_tokens if usage is not None else 0
+            completion_tokens = usage.completion_tokens if usage is not None else 0
+            cached_tokens = get_cached_tokens(usage) if usage is not None else 0
+            run_metrics.record(
+                type=labels["type"], lang=labels["lang"], backend=backend.name, model=kwargs["model"], status="ok",
+                latency=latency, total_time=time.monotonic() - call_started_at, queue_wait=queue_wait,
+                concurrency_limit=concurrency_limit,
+                pool_wait=http_timings.get("pool_wait", 0.0), connect_time=http_timings.get("connect_time", 0.0),
+                new_connection=http_timings.get("new_connection", False),
+                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=cached_tokens,
+                cost=estimate_cost(kwargs["model"], prompt_tokens, completion_tokens, cached_tokens,
+                                   backend.get_pricing(kwargs["model"])),
+                retries=attempt)
+        return completion, kwargs["model"]
+
+# 调用 ChatGPT 自动翻译 Front Matter 字段，使用这条规则的字段会在翻译前跨文件打包预翻译。
+# YAML 解析出的数字、日期等非字符串的值（例如 title: 2024）不需要翻译，原样保留
+def translate_front_matter_value(value, lang):
+    if not isinstance(value, str):
+        return value
+    return asyncio.create_task(translate_text(value, lang, "front-matter"))
 
 # Front Matter 处理规则
 front_matter_translation_rules = {
     # 调用 ChatGPT 自动翻译
-    "title": lambda value, lang: asyncio.create_task(translate_text(value, lang, "front-matter")),
-    "description": lambda value, lang: asyncio.create_task(translate_text(value, lang, "front-matter")),
+    "title": translate_front_matter_value,
+    "description": translate_front_matter_value,
     
     # 使用固定的替换规则
     "categories": lambda value, lang: front_matter_replace(value, lang),
@@ -179,38 +491,272 @@ front_matter_replace_rules = [
 
 ##############################
 
+# 替换规则编译后的替换引擎，占位词还原和 Front Matter 替换按语言在第一次使用时编译
+replace_rule_unmaskers = {}
+front_matter_replacers = {}
+
+def build_replace_mapping(rules, lang=None, placeholders=False):
+    """把替换规则转换为 {原文: 替换文本} 的映射，原文重复时以靠前的规则为准"""
+    mapping = {}
+    for i, rule in enumerate(rules):
+        if placeholders:
+            mapping.setdefault(rule["orginal_text"], f"[to_be_replace[{i + 1}]]")
+        else:
+            mapping.setdefault(rule["orginal_text"], rule["replaced_text"][lang])
+    return mapping
+
+# 原文替换为占位词与语言无关，只需编译一次
+replace_rule_masker = ReplaceEngine(build_replace_mapping(replace_rules, placeholders=True))
+
+def get_replace_rule_unmasker(lang):
+    """获取把占位词还原为某种语言替换文本的引擎"""
+    if lang not in replace_rule_unmaskers:
+        replace_rule_unmaskers[lang] = ReplaceEngine(
+            {f"[to_be_replace[{i + 1}]]": rule["replaced_text"][lang] for i, rule in enumerate(replace_rules)})
+    return replace_rule_unmaskers[lang]
+
 # 对 Front Matter 使用固定规则替换的函数
 def front_matter_replace(value, lang):
+    if lang not in front_matter_replacers:
+        front_matter_replacers[lang] = ReplaceEngine(build_replace_mapping(front_matter_replace_rules, lang))
+    replacer = front_matter_replacers[lang]
     for index in range(len(value)):
-        element = value[index]
-        # print(f"element[{index}] = {element}")
-        for replacement in front_matter_replace_rules:
-            if replacement["orginal_text"] in element:
-                # 使用 replace 函数逐个替换
-                element = element.replace(
-                    replacement["orginal_text"], replacement["replaced_text"][lang])
-        value[index] = element
-        # print(f"element[{index}] = {element}")
+        value[index] = replacer.replace(value[index])
     return value
 
 # 定义调用 ChatGPT API 翻译的函数
-async def translate_text(text, lang, type):
+# 多语言合并请求模式下的目标语言列表，为空时每种语言单独请求
+multi_lang_targets = []
+
+# 多语言合并请求，键为 (原文, 类型)，值为 [请求任务, 还没有取走结果的语言]。同一段原文的各语言共享一个请求，
+# 所有目标语言都取走结果后释放；有的语言不需要翻译这个文件时，在本轮翻译结束时释放
+multi_lang_requests = {}
+
+# 占位词的格式，多语言合并请求的结果需要保留原文中的所有占位词
+PLACEHOLDER_PATTERN = re.compile(r'\[to_be_replace\[[^\]]+\]\]')
+
+MULTI_LANG_INSTRUCTION = (
+    "\n\nYou will be given several target languages at once. Translate the text into each of them "
+    "and return a single JSON object whose keys are the given language codes and whose values are the "
+    "complete translations. Output only the JSON object."
+)
+
+def parse_multi_lang_response(content: str, text: str, langs: List[str]) -> Dict[str, str]:
+    """解析多语言合并请求返回的 JSON，只保留格式正确且占位词完整的语言"""
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    expected_placeholders = sorted(PLACEHOLDER_PATTERN.findall(text))
+    translations = {}
+    for lang in langs:
+        value = data.get(lang)
+        if not isinstance(value, str) or not value.strip():
+            continue
+        if sorted(PLACEHOLDER_PATTERN.findall(value)) != expected_placeholders:
+            continue
+        translations[lang] = value
+    return translations
+
+async def request_multi_lang_translation(text: str, type: str):
+    """一次请求把原文翻译为所有目标语言，返回 (校验通过的 {语言: 译文}, 实际使用的模型)"""
+    langs = multi_lang_targets
+    lang_list = ", ".join(f"{lang} ({SUPPORTED_LANGUAGES[lang]})" for lang in langs)
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPTS[type] + MULTI_LANG_INSTRUCTION},
+        {"role": "user", "content": f"Translate into the following languages: {lang_list}\n\n{text}\n"},
+    ]
+    estimated_tokens = (sum(estimate_tokens(message["content"]) for message in messages)
+                        + int(estimate_tokens(text) * OUTPUT_TOKEN_RATIO * len(langs)))
+    completion, model = await create_completion(
+        estimated_tokens,
+        {"type": type, "lang": "+".join(langs)},
+        model=MODEL_CONFIG[type],
+        messages=messages,
+        response_format={"type": "json_object"},
+        max_tokens=get_model_token_limits(type)["max_output"],
+        stream=stream_completions,
+        temperature=1.3
+    )
+    choice = completion.choices[0]
+    # 输出被截断时 JSON 不完整，全部回退到单语言请求
+    if choice.finish_reason == "length":
+        return {}, model
+    translations = parse_multi_lang_response(choice.message.content, text, langs)
+
+    # 各语言的结果分别写入缓存，之后其他语言的任务可以直接命中
+    if translation_cache is not None:
+        for lang, output_text in translations.items():
+            translation_cache.put(make_cache_key(text, lang, model, SYSTEM_PROMPTS[type]), output_text)
+    return translations, model
+
+async def translate_text_multi_lang(text: str, lang: str, type: str):
+    """通过多语言合并请求获取某种语言的 (译文, 模型)，解析或校验失败时返回 None"""
+    key = (text, type)
+    entry = multi_lang_requests.get(key)
+    if entry is None:
+        task = asyncio.create_task(request_multi_lang_translation(text, type))
+        entry = multi_lang_requests[key] = [task, set(multi_lang_targets)]
+        # 结果已写入缓存时，请求完成后即可释放，之后的语言直接命中缓存
+        if translation_cache is not None:
+            task.add_done_callback(lambda _: multi_lang_requests.pop(key, None))
+    task, pending_langs = entry
+    try:
+        translations, model = await asyncio.shield(task)
+    except Exception as e:
+        print(f"Multi-language request failed, falling back to {lang}: {e}")
+        sys.stdout.flush()
+        return None
+    finally:
+        # 不使用缓存时，所有目标语言都取走结果后释放
+        pending_langs.discard(lang)
+        if not pending_langs and multi_lang_requests.get(key) is entry:
+            del multi_lang_requests[key]
+    if lang not in translations:
+        return None
+    return translations[lang], model
+
+# 批量模式下第一遍收集到的请求，键为缓存键（同时作为批量任务的 custom_id），为 None 时不收集
+batch_requests = None
+
+# 预先取得的译文（批量任务的结果、Front Matter 打包翻译的结果），键为缓存键，翻译时优先使用
+prefetched_translations = {}
+
+# 正在进行中的翻译请求，键为 (规范化的原文, 语言, 类型)，值为请求任务。模型在路由时才确定，不作为键的一部分
+inflight_translations = {}
+
+# 合并到进行中请求的次数
+coalesce_stats = {"coalesced": 0}
+
+def normalize_text(text: str) -> str:
+    """统一换行符并去掉首尾空白，只差空白的重复段落可以合并为同一个请求"""
+    return text.replace("\r\n", "\n").strip()
+
+# 短语词典查询的每一行：行首的标题、列表标记和行尾空白原样保留，中间的内容整体作为短语查询
+PHRASE_LINE_PATTERN = re.compile(r'^(\s*(?:#{1,6}\s+|[-*+]\s+|\d+\.\s+)?)(.*?)(\s*)$')
+
+# 短语词典的命中统计：lookups/hits 为 translate_text 的查询次数和命中次数，paragraphs 为正文中直接替换的段落数
+phrase_stats = {"lookups": 0, "hits": 0, "paragraphs": 0}
+
+def lookup_phrase_dictionary(text: str, lang: str):
+    """片段的每个非空行都是词典中的短语（或占位词）时，在本地拼出译文，否则返回 None"""
+    output_lines = []
+    matched = False
+    for line in text.split("\n"):
+        if not line.strip() or not PLACEHOLDER_PATTERN.sub("", line).strip():
+            output_lines.append(line)
+            continue
+        prefix, phrase, suffix = PHRASE_LINE_PATTERN.match(line).groups()
+        translations = PHRASE_DICTIONARY.get(phrase)
+        if translations is None or lang not in translations:
+            return None
+        output_lines.append(prefix + translations[lang] + suffix)
+        matched = True
+    return "\n".join(output_lines) if matched else None
+
+def get_candidate_models(type: str) -> List[str]:
+    """可能翻译该提示词类型的模型：各后端的模型，以及批量模式使用的 MODEL_CONFIG 中的模型"""
+    models = [backend.models[type] for backend in backend_router.backends if type in backend.models]
+    return list(dict.fromkeys(models + [MODEL_CONFIG[type]]))
+
+def lookup_cached_translation(text: str, lang: str, type: str):
+    """按各候选模型的缓存键查询本地缓存和预先取得的译文，命中时返回 (译文, 模型)，否则返回 None"""
+    keys = {make_cache_key(text, lang, model, SYSTEM_PROMPTS[type]): model for model in get_candidate_models(type)}
+    if translation_cache is not None:
+        cached = translation_cache.get_any(keys)
+        if cached is not None:
+            return cached[1], keys[cached[0]]
+    for cache_key, model in keys.items():
+        if cache_key in prefetched_translations:
+            return prefetched_translations[cache_key], model
+    return None
+
+# 定义调用 ChatGPT API 翻译的函数
+async def translate_text(text, lang, type, models_used=None):
+    """翻译一段文本并返回译文。models_used 不为 None 时，把实际产生译文的模型加入其中（词典直接翻译的不加入）"""
     target_lang = SUPPORTED_LANGUAGES[lang]
-    
+
+    # 完全由词典短语组成的片段直接在本地翻译
+    phrase_stats["lookups"] += 1
+    output_text = lookup_phrase_dictionary(text, lang)
+    if output_text is not None:
+        phrase_stats["hits"] += 1
+        return output_text
+
+    # 先查询本地缓存，命中则跳过 API 调用
+    cached = lookup_cached_translation(text, lang, type)
+    if cached is not None:
+        output_text, model = cached
+        if models_used is not None:
+            models_used.add(model)
+        return output_text
+
+    # 批量模式的第一遍只收集请求，返回原文占位，不调用 API。批量任务使用 env.py 中的接口和 MODEL_CONFIG 中的模型
+    if batch_requests is not None:
+        cache_key = make_cache_key(text, lang, MODEL_CONFIG[type], SYSTEM_PROMPTS[type])
+        batch_requests[cache_key] = {
+            "model": MODEL_CONFIG[type],
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPTS[type]},
+                {"role": "user", "content": f"Translate into {target_lang}:\n\n{text}\n"},
+            ],
+            "max_tokens": get_token_limits(MODEL_CONFIG[type])["max_output"],
+            "temperature": 1.3,
+        }
+        return text
+
+    # 相同内容的请求正在进行时直接等待它的结果，避免重复调用 API
+    key = (normalize_text(text), lang, type)
+    task = inflight_translations.get(key)
+    if task is None:
+        task = asyncio.create_task(request_translation(text, lang, type))
+        inflight_translations[key] = task
+        task.add_done_callback(lambda _: inflight_translations.pop(key, None))
+    else:
+        coalesce_stats["coalesced"] += 1
+    output_text, model = await asyncio.shield(task)
+    if models_used is not None:
+        models_used.add(model)
+    return output_text
+
+async def request_translation(text, lang, type):
+    """调用 API 翻译，返回 (译文, 实际使用的模型)，并以实际使用的模型为键写入缓存"""
+    target_lang = SUPPORTED_LANGUAGES[lang]
+
+    # 多语言合并请求模式：一次请求翻译所有目标语言，失败时回退到单语言请求
+    if lang in multi_lang_targets:
+        result = await translate_text_multi_lang(text, lang, type)
+        if result is not None:
+            return result
+
     # Front Matter 与正文内容使用不同的 prompt 翻译
-    completion = await client.chat.completions.create(
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPTS[type]},
+        {"role": "user", "content": f"Translate into {target_lang}:\n\n{text}\n"},
+    ]
+
+    # 按估算的 prompt + completion token 数向限流器申请额度
+    estimated_tokens = (sum(estimate_tokens(message["content"]) for message in messages)
+                        + int(estimate_tokens(text) * OUTPUT_TOKEN_RATIO))
+    completion, model = await create_completion(
+        estimated_tokens,
+        {"type": type, "lang": lang},
         model=MODEL_CONFIG[type],
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPTS[type]},
-            {"role": "user", "content": f"Translate into {target_lang}:\n\n{text}\n"},
-        ],
-        stream=False,
+        messages=messages,
+        max_tokens=get_model_token_limits(type)["max_output"],
+        stream=stream_completions,
         temperature=1.3
     )
 
     # 获取翻译结果
     output_text = completion.choices[0].message.content
-    return output_text
+
+    # 写入缓存，下次遇到相同的段落时直接复用
+    if translation_cache is not None:
+        translation_cache.put(make_cache_key(text, lang, model, SYSTEM_PROMPTS[type]), output_text)
+    return output_text, model
 
 # Front Matter 处理规则
 async def translate_front_matter(front_matter, lang):
@@ -244,55 +790,363 @@ def is_media_file(filename: str) -> bool:
     """检查文件是否为媒体文件（图片或视频）"""
     return is_image_file(filename) or is_video_file(filename)
 
-def copy_media_file(input_file: str, output_file: str) -> None:
-    """拷贝图片文件到目标目录"""
+# 媒体文件的落盘方式，由 --media-strategy 指定
+MEDIA_STRATEGIES = ["copy", "hardlink", "reflink", "symlink"]
+media_strategy = DEFAULT_MEDIA_STRATEGY
+
+# Linux 上克隆文件数据块的 ioctl（FICLONE），Btrfs、XFS 等文件系统支持
+FICLONE = 0x40049409
+
+# 媒体文件的处理统计
+media_stats = {"copied": 0, "linked": 0, "skipped": 0}
+
+def hash_file(path: str) -> str:
+    """按块读取计算文件内容的哈希值"""
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def is_media_up_to_date(input_file: str, output_file: str, strategy: str) -> bool:
+    """目标文件已经与源文件一致时返回 True：同一个文件或指向源文件的链接，或大小和修改时间一致，或内容哈希一致"""
+    if strategy == "symlink":
+        return os.path.islink(output_file) and os.readlink(output_file) == os.path.abspath(input_file)
+    if not os.path.isfile(output_file) or os.path.islink(output_file):
+        return False
+    if os.path.samefile(input_file, output_file):
+        return True
+    if strategy == "hardlink":
+        return False
+    input_stat = os.stat(input_file)
+    output_stat = os.stat(output_file)
+    if input_stat.st_size != output_stat.st_size:
+        return False
+    if input_stat.st_mtime_ns == output_stat.st_mtime_ns:
+        return True
+    # 大小相同但修改时间不同（例如源文件被 touch 过），比较内容，一致时只同步修改时间
+    if hash_file(input_file) == hash_file(output_file):
+        shutil.copystat(input_file, output_file)
+        return True
+    return False
+
+def reflink_file(input_file: str, output_file: str) -> None:
+    """使用 FICLONE 创建共享数据块的副本，文件系统不支持时抛出 OSError"""
+    import fcntl
+    with open(input_file, "rb") as source, open(output_file, "wb") as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+    shutil.copystat(input_file, output_file)
+
+def copy_media_file(input_file: str, output_file: str, strategy: str = "copy") -> str:
+    """把媒体文件放到目标目录，返回实际使用的方式（copy/hardlink/reflink/symlink/skip）
+
+    目标文件已与源文件一致时跳过。先写入临时文件再替换，硬链接和 reflink 失败（跨设备、文件系统不支持）时回退为拷贝。
+    """
     # 确保目标目录存在
     output_dir = os.path.dirname(output_file)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    
-    # 拷贝文件
-    shutil.copy2(input_file, output_file)
 
-async def translate_file_async(input_file: str, relative_path: str, lang: str) -> None:
-    """异步处理单个文件的翻译"""
+    if is_media_up_to_date(input_file, output_file, strategy):
+        return "skip"
+
+    temp_file = output_file + ".part"
+    if os.path.lexists(temp_file):
+        os.remove(temp_file)
+    used = strategy
+    try:
+        if strategy == "hardlink":
+            os.link(input_file, temp_file)
+        elif strategy == "reflink":
+            reflink_file(input_file, temp_file)
+        elif strategy == "symlink":
+            os.symlink(os.path.abspath(input_file), temp_file)
+        else:
+            shutil.copy2(input_file, temp_file)
+    except OSError:
+        if strategy in ("copy", "symlink"):
+            raise
+        if os.path.lexists(temp_file):
+            os.remove(temp_file)
+        shutil.copy2(input_file, temp_file)
+        used = "copy"
+    os.replace(temp_file, output_file)
+    return used
+
+async def copy_media_async(input_file: str, relative_path: str, lang: str, source_hash: str) -> None:
+    """在线程中处理媒体文件，不占用事件循环和翻译任务的并发名额"""
+    used = await asyncio.to_thread(copy_media_file, input_file, get_output_file(relative_path, lang), media_strategy)
+    if used == "skip":
+        media_stats["skipped"] += 1
+    elif used == "copy":
+        media_stats["copied"] += 1
+    else:
+        media_stats["linked"] += 1
+    manifest.record(relative_path, lang, source_hash, None, None)
+
+def get_output_file(relative_path: str, lang: str) -> str:
+    """获取文件翻译后的输出路径，Markdown 文件的扩展名改为 .txt"""
+    output_dir = os.path.join(DIR_TRANSLATED[lang], os.path.dirname(relative_path))
+    if is_media_file(relative_path):
+        return os.path.join(output_dir, os.path.basename(relative_path))
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(relative_path))[0] + '.txt')
+
+def hash_text(text: str) -> str:
+    """计算文本内容的哈希值"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def get_media_fingerprint(stat: os.stat_result) -> str:
+    """媒体文件体积较大，使用文件大小和修改时间代替内容哈希"""
+    return f"stat:{stat.st_size}:{stat.st_mtime_ns}"
+
+def fingerprint_source(input_file: str, relative_path: str, stat: os.stat_result):
+    """读取源文件，返回 (源文件哈希, 是否有强制翻译标识)"""
+    if is_media_file(relative_path):
+        return get_media_fingerprint(stat), False
+    with open(input_file, "r", encoding="utf-8") as f:
+        md_content = f.read()
+    return hash_text(md_content), MARKER_FORCE_TRANSLATE in md_content
+
+# 代码围栏的开始行，例如 ```solidity 或 ~~~
+CODE_FENCE_PATTERN = re.compile(r'^\s*(`{3,}|~{3,})')
+# 代码中的注释行：以 //、#、/*、*、--、<!-- 开头，或行内带有 // 、# 注释
+CODE_COMMENT_PATTERN = re.compile(r'^\s*(//|#|/\*|\*|--|<!--)|\s(//|#)\s')
+# HTML 块的开始行
+HTML_BLOCK_PATTERN = re.compile(r'^ {0,3}<(!--|/?[a-zA-Z][a-zA-Z0-9-]*[\s/>]|/?[a-zA-Z][a-zA-Z0-9-]*$)')
+HTML_TAG_PATTERN = re.compile(r'<!--.*?-->|<[^>]*>', re.DOTALL)
+# 结构块占位词，使用内容哈希命名，文章其他位置改动时占位词保持不变，不影响缓存和增量翻译
+BLOCK_PLACEHOLDER_PATTERN = re.compile(r'\[to_be_replace\[k[0-9a-f]{10}\]\]')
+
+def make_block_placeholder(block_text: str, block_dict: Dict[str, str]) -> str:
+    """为不需要翻译的结构块生成占位词，并记录占位词对应的原文"""
+    placeholder = f"[to_be_replace[k{hash_text(block_text)[:10]}]]"
+    block_dict[placeholder] = block_text
+    return placeholder
+
+def mask_code_block(lines: List[str], block_dict: Dict[str, str]) -> List[str]:
+    """处理一个代码块（含围栏行）：没有注释的代码块整体替换为占位词；
+
+    有注释的代码块保留围栏行和注释行，其余连续的代码行合并为一个占位词，只把注释交给模型翻译。
+    """
+    body = lines[1:-1] if len(lines) > 1 and CODE_FENCE_PATTERN.match(lines[-1]) else lines[1:]
+    if not any(CODE_COMMENT_PATTERN.search(line) for line in body):
+        return [make_block_placeholder("\n".join(lines), block_dict)]
+
+    masked = [lines[0]]
+    code_run = []
+    for line in body:
+        if CODE_COMMENT_PATTERN.search(line):
+            if code_run:
+                masked.append(make_block_placeholder("\n".join(code_run), block_dict))
+                code_run = []
+            masked.append(line)
+        else:
+            code_run.append(line)
+    if code_run:
+        masked.append(make_block_placeholder("\n".join(code_run), block_dict))
+    masked.extend(lines[1 + len(body):])
+    return masked
+
+def mask_markdown_blocks(text: str):
+    """识别 Markdown 中不需要翻译的结构块（代码块、公式块、纯 HTML 块），替换为紧凑的占位词
+
+    返回 (处理后的文本, {占位词: 原文})。处理后代码块中不再有空行，按空行拆分段落时不会被拆开。
+    """
+    block_dict = {}
+    lines = text.split("\n")
+    masked_lines = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        fence_match = CODE_FENCE_PATTERN.match(line)
+        if fence_match:
+            # 找到相同字符、长度不小于开始围栏的结束围栏，没有结束围栏时一直到文末
+            fence = fence_match.group(1)
+            end = i + 1
+            while end < len(lines):
+                closing = re.match(r'^\s*(`{3,}|~{3,})\s*$', lines[end])
+                if closing and closing.group(1)[0] == fence[0] and len(closing.group(1)) >= len(fence):
+                    break
+                end += 1
+            block_lines = lines[i:end + 1]
+            masked_lines.extend(mask_code_block(block_lines, block_dict))
+            i = end + 1
+            continue
+
+        if line.strip().startswith("$$"):
+            # 公式块，到以 $$ 结尾的行为止
+            end = i
+            if line.strip() == "$$" or not line.strip().endswith("$$"):
+                end = i + 1
+                while end < len(lines) and not lines[end].strip().endswith("$$"):
+                    end += 1
+            masked_lines.append(make_block_placeholder("\n".join(lines[i:end + 1]), block_dict))
+            i = end + 1
+            continue
+
+        if HTML_BLOCK_PATTERN.match(line) and (i == 0 or not lines[i - 1].strip()):
+            # HTML 块到空行为止，只有不含文字内容的 HTML 块才替换为占位词
+            end = i
+            while end + 1 < len(lines) and lines[end + 1].strip():
+                end += 1
+            block_text = "\n".join(lines[i:end + 1])
+            if not HTML_TAG_PATTERN.sub("", block_text).strip():
+                masked_lines.append(make_block_placeholder(block_text, block_dict))
+                i = end + 1
+                continue
+
+        masked_lines.append(line)
+        i += 1
+    return "\n".join(masked_lines), block_dict
+
+def unmask_markdown_blocks(text: str, block_dict: Dict[str, str]) -> str:
+    """将结构块占位词还原为原文"""
+    return BLOCK_PLACEHOLDER_PATTERN.sub(lambda match: block_dict.get(match.group(0), match.group(0)), text)
+
+def mask_phrase_paragraphs(text: str, lang: str, block_dict: Dict[str, str]) -> str:
+    """把完全由词典短语组成的段落（如小节标题）替换为占位词，这些段落不再发送给模型，还原时替换为该语言的译文
+
+    占位词按原文段落生成，各目标语言的分块原文相同，--multi-lang 模式下仍能合并为一个请求。
+    合并请求时只有所有目标语言都有译文的段落才替换，否则各语言的分块原文会不同。
+    """
+    paragraphs = text.split("\n\n")
+    for i, paragraph in enumerate(paragraphs):
+        output_text = lookup_phrase_dictionary(paragraph, lang)
+        if output_text is None:
+            continue
+        if lang in multi_lang_targets and any(lookup_phrase_dictionary(paragraph, other) is None
+                                              for other in multi_lang_targets):
+            continue
+        placeholder = make_block_placeholder(paragraph, block_dict)
+        block_dict[placeholder] = output_text
+        paragraphs[i] = placeholder
+        phrase_stats["paragraphs"] += 1
+    return "\n\n".join(paragraphs)
+
+def get_token_limits(model: str) -> Dict[str, int]:
+    """获取模型的上下文窗口和最大输出 token 数"""
+    return MODEL_TOKEN_LIMITS.get(model, DEFAULT_MODEL_TOKEN_LIMITS)
+
+def get_model_token_limits(type: str) -> Dict[str, int]:
+    """获取某类翻译可能用到的所有模型中最小的上下文窗口和最大输出 token 数，分块按它拆分，任何后端都能处理"""
+    limits = [get_token_limits(model) for model in get_candidate_models(type)]
+    return {"context": min(l["context"] for l in limits), "max_output": min(l["max_output"] for l in limits)}
+
+def get_chunk_token_budget(type: str = "main-body") -> int:
+    """按模型的 token 限制计算单个分块的原文 token 预算，并为译文预留空间"""
+    limits = get_model_token_limits(type)
+    prompt_tokens = estimate_tokens(SYSTEM_PROMPTS[type]) + estimate_tokens(MULTI_LANG_INSTRUCTION) + 50
+    # 多语言合并请求一次输出所有目标语言的译文
+    output_count = max(1, len(multi_lang_targets))
+    budget = chunk_token_budget(limits["context"], limits["max_output"], prompt_tokens,
+                                OUTPUT_TOKEN_RATIO, output_count)
+    return min(budget, MAX_CHUNK_TOKENS)
+
+def split_into_chunks(paragraphs: List[str]) -> List[List[str]]:
+    """将段落按 token 预算合并为若干分块，每个分块是一组连续的段落"""
+    budget = get_chunk_token_budget()
+    chunks = []
+    current_chunk = []
+    current_tokens = 0
+    for paragraph in paragraphs:
+        # 段落之间的空行大约占一个 token
+        paragraph_tokens = estimate_tokens(paragraph) + 1
+        # 如果当前分块加上新段落超过 token 预算，就开始一个新的分块
+        if current_chunk and current_tokens + paragraph_tokens > budget:
+            chunks.append(current_chunk)
+            current_chunk = []
+            current_tokens = 0
+        current_chunk.append(paragraph)
+        current_tokens += paragraph_tokens
+    if current_chunk:
+        chunks.append(current_chunk)
+    return chunks
+
+def plan_chunks(paragraphs: List[str], snapshot: List[Dict[str, Any]]) -> List[tuple]:
+    """对照上次翻译的快照规划分块，返回 (段落列表, 可复用的译文或 None, 译文所用的模型或 None) 的列表
+
+    原文中与快照某个分块完全一致的连续段落会沿用快照的分块边界和译文，
+    其余改动过的段落重新按最大长度合并为新的分块。
+    """
+    # 以分块的第一个段落为索引，方便快速查找候选分块
+    candidates = {}
+    for entry in snapshot:
+        if entry["paragraphs"]:
+            candidates.setdefault(entry["paragraphs"][0], []).append(entry)
+
+    planned = []
+    pending = []
+    i = 0
+    while i < len(paragraphs):
+        matched = None
+        for entry in candidates.get(paragraphs[i], []):
+            length = len(entry["paragraphs"])
+            if paragraphs[i:i + length] == entry["paragraphs"]:
+                matched = entry
+                break
+        if matched is None:
+            pending.append(paragraphs[i])
+            i += 1
+            continue
+        # 先把之前累积的改动段落作为新分块，再加入可复用的分块
+        planned.extend((chunk, None, None) for chunk in split_into_chunks(pending))
+        pending = []
+        planned.append((matched["paragraphs"], matched["translation"], matched.get("model")))
+        i += len(matched["paragraphs"])
+    planned.extend((chunk, None, None) for chunk in split_into_chunks(pending))
+    return planned
+
+def get_snapshot_path(relative_path: str, lang: str) -> str:
+    """获取翻译快照的保存路径"""
+    return os.path.join(SNAPSHOT_DIR, lang, relative_path + ".json")
+
+def load_snapshot(relative_path: str, lang: str) -> List[Dict[str, Any]]:
+    """读取上次翻译的快照，不存在或无法解析时返回空列表"""
+    snapshot_path = get_snapshot_path(relative_path, lang)
+    if not os.path.exists(snapshot_path):
+        return []
+    try:
+        with open(snapshot_path, "r", encoding="utf-8") as f:
+            return json.load(f)["chunks"]
+    except (ValueError, KeyError):
+        return []
+
+# 分块日志，在 main_async 中初始化，为 None 时不记录
+chunk_journal = None
+
+# Front Matter 的格式
+FRONT_MATTER_PATTERN = re.compile(r'^---\s*\n(.*?)\n---\s*\n', re.DOTALL)
+
+def apply_replace_rules(input_text: str) -> str:
+    """一次扫描将替换规则中的固定文本全部替换为占位词"""
+    return replace_rule_masker.replace(input_text)
+
+async def translate_file_async(input_file: str, relative_path: str, lang: str, source_hash: str,
+                               incremental: bool = True, dry_run: bool = False) -> None:
+    """异步处理单个文件的翻译，dry_run 为 True 时只走一遍翻译流程，不写入任何输出"""
+    start_time = time.monotonic()
     print(f"Translating into {lang}: {relative_path}")
     sys.stdout.flush()
 
-    # 如果是媒体文件（图片或视频），只在目标语言目录下拷贝
-    if is_media_file(input_file):
-        output_dir = os.path.join(DIR_TRANSLATED[lang], os.path.dirname(relative_path))
-        output_file = os.path.join(output_dir, os.path.basename(relative_path))
-        copy_media_file(input_file, output_file)
-        return
-
     # 定义输出文件
-    if lang in DIR_TRANSLATED:
-        output_dir = os.path.join(DIR_TRANSLATED[lang], os.path.dirname(relative_path))
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        # 将输出文件扩展名改为 .txt
-        output_file = os.path.join(output_dir, os.path.splitext(os.path.basename(relative_path))[0] + '.txt')
+    output_file = get_output_file(relative_path, lang)
+    output_dir = os.path.dirname(output_file)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
 
     # 读取输入文件内容
     with open(input_file, "r", encoding="utf-8") as f:
         input_text = f.read()
     # 删除 [Lesson Info](xxx) 这样的行
     input_text = re.sub(r'^\[Lesson Info\]\([^)]+\)\s*$', '', input_text, flags=re.MULTILINE)
+    # 删除指示强制翻译的 marker
+    input_text = input_text.replace(MARKER_FORCE_TRANSLATE, "")
 
-    # 创建一个字典来存储占位词和对应的替换文本
-    placeholder_dict = {}
-
-    # 使用 for 循环应用替换规则，并将匹配的文本替换为占位词
-    for i, rule in enumerate(replace_rules):
-        find_text = rule["orginal_text"]
-        replace_with = rule["replaced_text"][lang]
-        placeholder = f"[to_be_replace[{i + 1}]]"
-        input_text = input_text.replace(find_text, placeholder)
-        placeholder_dict[placeholder] = replace_with
+    # 应用替换规则，将匹配的文本替换为占位词
+    input_text = apply_replace_rules(input_text)
 
     # 使用正则表达式来匹配 Front Matter
-    front_matter_match = re.search(r'^---\s*\n(.*?)\n---\s*\n', input_text, re.DOTALL)
+    front_matter_match = FRONT_MATTER_PATTERN.search(input_text)
     front_matter_text = ""
     if front_matter_match:
         front_matter_text = front_matter_match.group(1)
@@ -312,81 +1166,546 @@ async def translate_file_async(input_file: str, relative_path: str, lang: str) -
     else:
         pass
 
-    # 拆分文章
-    paragraphs = input_text.split("\n\n")
-    input_text = ""
-    output_paragraphs = []
-    current_paragraph = ""
+    # 代码块、公式块等不需要翻译的结构块替换为占位词，不发送给模型
+    input_text, block_dict = mask_markdown_blocks(input_text)
+    input_text = mask_phrase_paragraphs(input_text, lang, block_dict)
 
-    for paragraph in paragraphs:
-        if len(current_paragraph) + len(paragraph) + 2 <= MAX_LENGTH:
-            # 如果当前段落加上新段落的长度不超过最大长度，就将它们合并
-            if current_paragraph:
-                current_paragraph += "\n\n"
-            current_paragraph += paragraph
-        else:
-            # 否则翻译当前段落，并将翻译结果添加到输出列表中
-            translated_text = await translate_text(current_paragraph, lang, "main-body")
-            output_paragraphs.append(translated_text)
-            current_paragraph = paragraph
-
-    # 处理最后一个段落
-    if current_paragraph:
-        if len(current_paragraph) + len(input_text) <= MAX_LENGTH:
-            # 如果当前段落加上之前的文本长度不超过最大长度，就将它们合并
-            input_text += "\n\n" + current_paragraph
-        else:
-            # 否则翻译当前段落，并将翻译结果添加到输出列表中
-            translated_text = await translate_text(current_paragraph, lang, "main-body")
-            output_paragraphs.append(translated_text)
+    # 拆分文章。如果存在上次翻译的快照，原文未改动的分块直接复用已有译文，只翻译改动过的分块
+    paragraphs = input_text.split("\n\n")
+    chunks = plan_chunks(paragraphs, load_snapshot(relative_path, lang) if incremental else [])
+    reused_count = sum(1 for _, translated_text, _ in chunks if translated_text is not None)
 
-    # 如果还有未翻译的文本，就将它们添加到输出列表中
-    if input_text:
-        translated_text = await translate_text(input_text, lang, "main-body")
-        output_paragraphs.append(translated_text)
+    # 同一文件的所有分块并发翻译，并发数由全局并发控制器控制，gather 保证结果按原文顺序排列。
+    # 每个分块返回 (译文, 产生译文的模型)，不需要调用模型的分块模型为 None
+    async def translate_chunk(index, chunk_paragraphs, translated_text, model):
+        if translated_text is not None:
+            return translated_text, model
+        chunk_text = "\n\n".join(chunk_paragraphs)
+        # 只有占位词的分块不需要翻译
+        if not BLOCK_PLACEHOLDER_PATTERN.sub("", chunk_text).strip():
+            return chunk_text, None
+        # 上次运行中断前已完成的分块直接使用分块日志中的译文
+        if chunk_journal is not None:
+            journaled = chunk_journal.lookup(relative_path, lang, index, source_hash, chunk_text)
+            if journaled is not None:
+                return journaled
+        models_used = set()
+        translated_text = await translate_text(chunk_text, lang, "main-body", models_used)
+        # 模型丢失了结构块占位词时，改为发送还原后的原文重新翻译
+        if set(BLOCK_PLACEHOLDER_PATTERN.findall(chunk_text)) - set(BLOCK_PLACEHOLDER_PATTERN.findall(translated_text)):
+            print(f"Block placeholders lost in {lang}: {relative_path}, retrying chunk without masking")
+            sys.stdout.flush()
+            models_used = set()
+            translated_text = await translate_text(unmask_markdown_blocks(chunk_text, block_dict), lang, "main-body",
+                                                   models_used)
+        model = models_used.pop() if models_used else None
+        if chunk_journal is not None and not dry_run:
+            chunk_journal.append(relative_path, lang, index, source_hash, chunk_text, translated_text, model)
+        return translated_text, model
 
-    # 将输出段落合并为字符串
-    output_text = "\n\n".join(output_paragraphs)
+    def restore_placeholders(text):
+        # 还原结构块，再将占位词替换为对应的替换文本
+        text = unmask_markdown_blocks(text, block_dict)
+        return get_replace_rule_unmasker(lang).replace(text)
 
-    if front_matter_match:
-        # 加入 Front Matter
-        output_text = "---\n" + front_matter_text_processed + "---\n\n" + output_text
+    # 译文先写入临时文件，每个分块按原文顺序完成后立即写入，全部完成后再替换为正式的输出文件。
+    # 本次翻译的快照（原文分块和对应译文，供下次增量翻译使用）同样逐个分块写入临时文件，
+    # 已写入的分块不再保留在内存中，峰值内存与文件大小无关。
+    # 运行中断时，已完成的分块保留在分块日志中，使用 --resume 重新运行时不需要重新翻译
+    chunk_tasks = [asyncio.create_task(translate_chunk(index, chunk_paragraphs, translated_text, model))
+                   for index, (chunk_paragraphs, translated_text, model) in enumerate(chunks)]
+    if dry_run:
+        await asyncio.gather(*chunk_tasks)
+        return
+    temp_output_file = output_file + ".part"
+    snapshot_path = get_snapshot_path(relative_path, lang)
+    temp_snapshot_file = snapshot_path + ".part"
+    if not os.path.exists(os.path.dirname(snapshot_path)):
+        os.makedirs(os.path.dirname(snapshot_path))
+    output_hash = hashlib.sha256()
+    output_models = set()
+    try:
+        with open(temp_output_file, "w", encoding="utf-8") as f, \
+                open(temp_snapshot_file, "w", encoding="utf-8") as snapshot_file:
+            def write_output(text):
+                f.write(text)
+                f.flush()
+                output_hash.update(text.encode("utf-8"))
 
-    # 最后，将占位词替换为对应的替换文本
-    for placeholder, replacement in placeholder_dict.items():
-        output_text = output_text.replace(placeholder, replacement)
+            if front_matter_match:
+                # 加入 Front Matter
+                write_output(restore_placeholders("---\n" + front_matter_text_processed + "---\n\n"))
+            snapshot_file.write('{"chunks": [')
+            for index in range(len(chunk_tasks)):
+                translated_text, model = await chunk_tasks[index]
+                chunk_paragraphs = chunks[index][0]
+                # 释放已完成的分块，之后只保留在输出文件和快照文件中
+                chunk_tasks[index] = chunks[index] = None
+                if model is not None:
+                    output_models.add(model)
+                write_output(("\n\n" if index else "") + restore_placeholders(translated_text))
+                snapshot_file.write(("," if index else "") + json.dumps(
+                    {"paragraphs": chunk_paragraphs, "translation": translated_text, "model": model}, ensure_ascii=False))
+                if index == 0:
+                    print(f"First chunk of {lang}: {relative_path} written after {time.monotonic() - start_time:.1f}s")
+                    sys.stdout.flush()
+            snapshot_file.write("]}")
+    finally:
+        # 出错时取消该文件尚未完成的分块
+        for task in chunk_tasks:
+            if task is not None:
+                task.cancel()
+    os.replace(temp_output_file, output_file)
+    os.replace(temp_snapshot_file, snapshot_path)
 
-    # 写入输出文件
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(output_text)
+    if reused_count:
+        print(f"Reused {reused_count}/{len(chunks)} unchanged chunks for {lang}: {relative_path}")
         
-    # 在文件成功翻译完成后，将其添加到 processed_list
-    # 先读取已处理的文件列表
-    with open(DEFAULT_PROCESSED_LIST, "r", encoding="utf-8") as f:
-        processed_list_content = f.read().splitlines()
-    
-    # 只有当文件不在列表中时才添加
-    if relative_path not in processed_list_content:
-        print(f"Added into processed_list: {relative_path}")
-        with open(DEFAULT_PROCESSED_LIST, "a", encoding="utf-8") as f:
-            f.write(f"{relative_path}\n")
-
-async def process_files_async(files_to_translate: List[tuple], target_langs: List[str]) -> None:
-    """并发处理多个文件"""
-    tasks = []
-    for input_file, relative_path in files_to_translate:
-        for lang in target_langs:
-            tasks.append(translate_file_async(input_file, relative_path, lang))
-    
-    # 使用信号量限制并发数
+    # 在文件成功翻译完成后，将其记录到翻译清单。模型为实际产生正文译文的模型，多个后端参与时用 + 连接
+    manifest.record(relative_path, lang, source_hash, output_hash.hexdigest(), "+".join(sorted(output_models)) or None)
+
+def estimate_job_chunks(input_file: str) -> List[float]:
+    """按分块数和 token 数估算一个翻译任务中每个分块的耗时，单位为输出 token
+
+    每个分块是一次请求，固定开销折算为 SCHEDULER_REQUEST_OVERHEAD_TOKENS 个输出 token。
+    快照中未改动的分块不会调用 API，因此对增量翻译的任务这是一个上限。
+    """
+    with open(input_file, "r", encoding="utf-8") as f:
+        tokens = estimate_tokens(f.read())
+    chunks = max(1, -(-tokens // get_chunk_token_budget()))
+    return [SCHEDULER_REQUEST_OVERHEAD_TOKENS + tokens / chunks * OUTPUT_TOKEN_RATIO] * chunks
+
+def report_schedule(chunk_costs: Dict[tuple, List[float]], predicted: Dict[tuple, float],
+                    started: Dict[tuple, float], finished: Dict[tuple, float], slots: int) -> None:
+    """输出本轮的预计和实际总耗时，并把每个任务的预计和实际完成时间写入指标目录"""
+    request_seconds = sum(r["latency"] for r in run_metrics.records if r["type"] == "main-body" and r["status"] == "ok")
+    seconds_per_unit, makespan = compare_schedule(chunk_costs, predicted, finished, request_seconds, slots)
+    print(f"Schedule (longest first, {slots} request slots): predicted makespan {makespan['predicted']:.1f}s, "
+          f"actual {makespan['actual']:.1f}s, lower bound {makespan['ideal']:.1f}s")
+    rows = []
+    for job in finished:
+        input_file, relative_path, lang, source_hash = job
+        rows.append({"path": relative_path, "lang": lang, "chunks": len(chunk_costs[job]),
+                     "estimated_cost": round(sum(chunk_costs[job]), 1),
+                     "predicted_finish": round(predicted[job] * seconds_per_unit, 3),
+                     "actual_start": round(started[job], 3), "actual_finish": round(finished[job], 3)})
+    print(f"Job schedule written to {run_metrics.write_jobs(rows)}")
+    sys.stdout.flush()
+
+async def process_files_async(jobs_to_translate: List[tuple], incremental: bool = True, dry_run: bool = False) -> None:
+    """并发处理多个文件，每个任务为 (源文件, 相对路径, 目标语言, 源文件哈希)
+
+    媒体文件走单独的 I/O 通道，使用自己的信号量，不占用翻译任务的并发名额。
+    翻译任务按预计耗时从长到短派发，避免大文件排在最后单独拖尾。
+    """
+    # dry_run 只用于收集翻译请求，不需要处理媒体文件
+    if dry_run:
+        jobs_to_translate = [job for job in jobs_to_translate if not is_media_file(job[0])]
+
+    # 同一源文件的各语言任务耗时相同，只估算一次
+    file_chunks = {}
+    chunk_costs = {}
+    for job in jobs_to_translate:
+        if not is_media_file(job[0]):
+            if job[0] not in file_chunks:
+                file_chunks[job[0]] = estimate_job_chunks(job[0])
+            chunk_costs[job] = file_chunks[job[0]]
+    # 信号量按等待顺序放行，按这个顺序创建任务即按最长任务优先派发。媒体文件走单独的通道，放在最后
+    dispatch_order = order_longest_first(chunk_costs)
+    jobs_to_translate = dispatch_order + [job for job in jobs_to_translate if job not in chunk_costs]
+    slots = backend_router.total_concurrency_limit
+    # 按实际的派发顺序模拟，预计的完成时间才与实际运行的调度一致
+    predicted = simulate_schedule(dispatch_order, chunk_costs, slots)
+    started = {}
+    finished = {}
+    round_started_at = time.monotonic()
+
+    # 使用信号量分别限制翻译任务和媒体文件的并发数
     semaphore = asyncio.Semaphore(MAX_CONCURRENT_FILES)
-    async def bounded_process(task):
+    media_semaphore = asyncio.Semaphore(MAX_CONCURRENT_MEDIA)
+    async def bounded_process(input_file, relative_path, lang, source_hash):
+        if is_media_file(input_file):
+            async with media_semaphore:
+                return await copy_media_async(input_file, relative_path, lang, source_hash)
+        job = (input_file, relative_path, lang, source_hash)
         async with semaphore:
-            return await task
-    
-    await asyncio.gather(*[bounded_process(task) for task in tasks])
+            started[job] = time.monotonic() - round_started_at
+            await translate_file_async(input_file, relative_path, lang, source_hash, incremental, dry_run)
+            finished[job] = time.monotonic() - round_started_at
+
+    # 单个任务失败不影响其他任务，全部结束后再统一报告失败的任务
+    results = await asyncio.gather(*[bounded_process(*job) for job in jobs_to_translate], return_exceptions=True)
+    if finished and not dry_run and run_metrics is not None:
+        report_schedule(chunk_costs, predicted, started, finished, slots)
+    failed_jobs = []
+    for (input_file, relative_path, lang, source_hash), result in zip(jobs_to_translate, results):
+        if isinstance(result, Exception):
+            print(f"Failed to translate into {lang}: {relative_path}: {result}")
+            failed_jobs.append((relative_path, lang))
+    sys.stdout.flush()
+    if failed_jobs:
+        raise RuntimeError(f"{len(failed_jobs)} of {len(jobs_to_translate)} translation jobs failed")
+
+FRONT_MATTER_BATCH_INSTRUCTION = (
+    "\n\nYou will be given a JSON object whose values are independent texts. Translate every value "
+    "separately and return a JSON object with exactly the same keys, whose values are the translations. "
+    "Output only the JSON object."
+)
+
+def collect_front_matter_values(jobs_to_translate: List[tuple]) -> Dict[str, List[str]]:
+    """读取所有待翻译文章的 Front Matter，按语言收集需要 ChatGPT 翻译的字段值（已去重）"""
+    values_by_lang = {}
+    front_matter_by_file = {}
+    for input_file, relative_path, lang, source_hash in jobs_to_translate:
+        if is_media_file(input_file):
+            continue
+        if input_file not in front_matter_by_file:
+            with open(input_file, "r", encoding="utf-8") as f:
+                input_text = f.read().replace(MARKER_FORCE_TRANSLATE, "")
+            # 替换规则的占位词与语言无关，与 translate_file_async 中发送给模型的原文保持一致
+            input_text = apply_replace_rules(input_text)
+            front_matter_match = FRONT_MATTER_PATTERN.search(input_text)
+            front_matter_data = None
+            if front_matter_match:
+                try:
+                    front_matter_data = yaml.safe_load(front_matter_match.group(1))
+                except yaml.YAMLError:
+                    pass
+            front_matter_by_file[input_file] = front_matter_data if isinstance(front_matter_data, dict) else {}
+        lang_values = values_by_lang.setdefault(lang, {})
+        for key, value in front_matter_by_file[input_file].items():
+            if front_matter_translation_rules.get(key) is translate_front_matter_value and isinstance(value, str) and value.strip():
+                # 词典可以直接翻译的值不需要打包请求
+                if lookup_phrase_dictionary(value, lang) is None:
+                    lang_values[value] = None
+    return {lang: list(values) for lang, values in values_by_lang.items()}
+
+async def request_front_matter_batch(values: List[str], lang: str) -> None:
+    """一次请求翻译多个 Front Matter 字段值，结果按编号对应回原文，解析失败的值之后单独翻译"""
+    type = "front-matter"
+    numbered = {str(i + 1): value for i, value in enumerate(values)}
+    payload = json.dumps(numbered, ensure_ascii=False, indent=1)
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPTS[type] + FRONT_MATTER_BATCH_INSTRUCTION},
+        {"role": "user", "content": f"Translate into {SUPPORTED_LANGUAGES[lang]}:\n\n{payload}\n"},
+    ]
+    estimated_tokens = (sum(estimate_tokens(message["content"]) for message in messages)
+                        + int(estimate_tokens(payload) * OUTPUT_TOKEN_RATIO))
+    try:
+        completion, model = await create_completion(
+            estimated_tokens,
+            {"type": "front-matter-batch", "lang": lang, "prompt_type": type},
+            model=MODEL_CONFIG[type],
+            messages=messages,
+            response_format={"type": "json_object"},
+            max_tokens=get_model_token_limits(type)["max_output"],
+            stream=stream_completions,
+            temperature=1.3
+        )
+    except Exception as e:
+        print(f"Front matter batch request failed for {lang}, falling back to single requests: {e}")
+        sys.stdout.flush()
+        return
+    choice = completion.choices[0]
+    if choice.finish_reason == "length":
+        return
+    try:
+        data = json.loads(choice.message.content)
+    except (TypeError, ValueError):
+        return
+    if not isinstance(data, dict):
+        return
+    for number, value in numbered.items():
+        output_text = data.get(number)
+        if not isinstance(output_text, str) or not output_text.strip():
+            continue
+        if sorted(PLACEHOLDER_PATTERN.findall(output_text)) != sorted(PLACEHOLDER_PATTERN.findall(value)):
+            continue
+        cache_key = make_cache_key(value, lang, model, SYSTEM_PROMPTS[type])
+        prefetched_translations[cache_key] = output_text
+        if translation_cache is not None:
+            translation_cache.put(cache_key, output_text)
+
+async def prefetch_front_matter(jobs_to_translate: List[tuple]) -> None:
+    """跨文件打包翻译 Front Matter 字段，避免每篇文章的每个字段都单独发送一次请求
+
+    缓存中已有的值会跳过；每个请求最多包含 FRONT_MATTER_BATCH_SIZE 个值，并受分块 token 预算限制。
+    """
+    type = "front-matter"
+    token_budget = get_chunk_token_budget(type)
+    tasks = []
+    for lang, values in collect_front_matter_values(jobs_to_translate).items():
+        pending = []
+        for value in values:
+            if translation_cache is not None and lookup_cached_translation(value, lang, type) is not None:
+                continue
+            pending.append(value)
+        packed = []
+        packed_tokens = 0
+        for value in pending:
+            value_tokens = estimate_tokens(value) + 5
+            if packed and (len(packed) >= FRONT_MATTER_BATCH_SIZE or packed_tokens + value_tokens > token_budget):
+                tasks.append(request_front_matter_batch(packed, lang))
+                packed, packed_tokens = [], 0
+            packed.append(value)
+            packed_tokens += value_tokens
+        # 只剩一个值时不需要打包，交给正常的翻译流程
+        if len(packed) > 1:
+            tasks.append(request_front_matter_batch(packed, lang))
+    if tasks:
+        print(f"Translating front matter in {len(tasks)} packed requests")
+        sys.stdout.flush()
+        await asyncio.gather(*tasks)
+
+def get_batch_state_path() -> str:
+    return os.path.join(BATCH_DIR, "state.json")
+
+def get_batch_results_path() -> str:
+    return os.path.join(BATCH_DIR, "results.jsonl")
+
+def load_batch_state():
+    """读取未完成的批量任务状态，不存在时返回 None"""
+    if not os.path.exists(get_batch_state_path()):
+        return None
+    with open(get_batch_state_path(), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_batch_state(state: Dict[str, Any]) -> None:
+    """保存批量任务状态，进程重启后可以继续轮询和下载结果"""
+    temp_path = get_batch_state_path() + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, get_batch_state_path())
+
+async def submit_batches(requests: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """把收集到的请求写成批量任务的 JSONL 文件，上传并创建批量任务"""
+    if not os.path.exists(BATCH_DIR):
+        os.makedirs(BATCH_DIR)
+    state = {"batches": []}
+    items = list(requests.items())
+    for start in range(0, len(items), BATCH_MAX_REQUESTS):
+        input_path = os.path.join(BATCH_DIR, f"requests-{start // BATCH_MAX_REQUESTS}.jsonl")
+        with open(input_path, "w", encoding="utf-8") as f:
+            for custom_id, body in items[start:start + BATCH_MAX_REQUESTS]:
+                f.write(json.dumps({"custom_id": custom_id, "method": "POST",
+                                    "url": "/v1/chat/completions", "body": body}, ensure_ascii=False) + "\n")
+        with open(input_path, "rb") as f:
+            input_file = await client.files.create(file=f, purpose="batch")
+        batch = await client.batches.create(
+            input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        print(f"Submitted batch {batch.id} with {min(BATCH_MAX_REQUESTS, len(items) - start)} requests")
+        sys.stdout.flush()
+        state["batches"].append({"id": batch.id, "input_file_id": input_file.id, "downloaded": False})
+        # 每提交一个批量任务就保存一次状态，避免中断后重复提交
+        save_batch_state(state)
+    return state
+
+async def collect_batch_results(state: Dict[str, Any]) -> None:
+    """轮询批量任务直到结束，并把结果追加到结果文件和翻译缓存中"""
+    for batch_info in state["batches"]:
+        if batch_info["downloaded"]:
+            continue
+        while True:
+            batch = await client.batches.retrieve(batch_info["id"])
+            if batch.status in ("completed", "failed", "expired", "cancelled"):
+                break
+            counts = batch.request_counts
+            progress = f"{counts.completed}/{counts.total}" if counts is not None else "?"
+            print(f"Batch {batch.id} is {batch.status} ({progress}), checking again in {BATCH_POLL_INTERVAL}s")
+            sys.stdout.flush()
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+
+        print(f"Batch {batch.id} finished with status {batch.status}")
+        sys.stdout.flush()
+        if batch.output_file_id:
+            content = await client.files.content(batch.output_file_id)
+            succeeded = 0
+            with open(get_batch_results_path(), "a", encoding="utf-8") as f:
+                for line in content.text.splitlines():
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    response = item.get("response") or {}
+                    if response.get("status_code") != 200:
+                        continue
+                    output_text = response["body"]["choices"][0]["message"]["content"]
+                    f.write(json.dumps({"custom_id": item["custom_id"], "text": output_text}, ensure_ascii=False) + "\n")
+                    if translation_cache is not None:
+                        translation_cache.put(item["custom_id"], output_text)
+                    succeeded += 1
+            print(f"Downloaded {succeeded} results from batch {batch.id}")
+            sys.stdout.flush()
+        batch_info["downloaded"] = True
+        save_batch_state(state)
+
+async def run_batch_mode(jobs_to_translate: List[tuple], incremental: bool) -> None:
+    """批量模式：第一遍收集所有分块请求并提交批量任务，等待完成后第二遍用返回的译文生成输出文件
+
+    批量任务的状态保存在 BATCH_DIR 中，进程重启后会继续轮询未完成的任务，不会重复提交。
+    没有拿到结果的请求在第二遍中按普通方式实时翻译。
+    """
+    global batch_requests
+    state = load_batch_state()
+    if state is None:
+        batch_requests = {}
+        try:
+            await process_files_async(jobs_to_translate, incremental, dry_run=True)
+            requests = batch_requests
+        finally:
+            batch_requests = None
+        print(f"Collected {len(requests)} requests for batch submission")
+        sys.stdout.flush()
+        if requests:
+            state = await submit_batches(requests)
+    else:
+        print(f"Resuming {len(state['batches'])} submitted batches from {get_batch_state_path()}")
+        sys.stdout.flush()
+
+    if state is not None:
+        await collect_batch_results(state)
+    if os.path.exists(get_batch_results_path()):
+        with open(get_batch_results_path(), "r", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                prefetched_translations[item["custom_id"]] = item["text"]
+
+    await process_files_async(jobs_to_translate, incremental)
+
+    # 输出文件全部生成后，清理批量任务的中间文件
+    if os.path.exists(BATCH_DIR):
+        shutil.rmtree(BATCH_DIR)
+
+# 源文件索引，在 main_async 中初始化
+source_index = None
+
+def stat_source_files(dir_to_translate: str, relative_paths):
+    """按相对路径逐个获取源文件的 stat，返回格式与 scan_source_tree 相同；已删除的文件从源文件索引中移除"""
+    for relative_path in sorted(relative_paths):
+        if any(part.startswith(SKIPPED_PATH_PREFIXES) for part in relative_path.split(os.sep)):
+            continue
+        input_file = os.path.join(dir_to_translate, relative_path)
+        try:
+            stat = os.stat(input_file)
+        except FileNotFoundError:
+            source_index.forget(relative_path)
+            continue
+        if os.path.isfile(input_file):
+            yield input_file, relative_path, os.path.basename(relative_path), stat
+
+def collect_jobs(dir_to_translate: str, exclude_list: List[str], targets: List[str], changed_paths=None) -> List[tuple]:
+    """收集需要翻译的 (文件, 语言) 任务，changed_paths 为 None 时扫描整个源目录，否则只检查这些相对路径
+
+    源文件索引中大小和修改时间未变的文件不需要重新读取和计算哈希。
+    """
+    jobs_to_translate = []
+    scan_started_at = time.monotonic()
+    skipped_files = 0
+    source_index.start_scan(full=changed_paths is None)
+    if changed_paths is None:
+        source_files = scan_source_tree(dir_to_translate)
+    else:
+        source_files = stat_source_files(dir_to_translate, changed_paths)
+    for input_file, relative_path, filename, stat in source_files:
+        if filename in exclude_list:  # 不进行翻译
+            print(f"Pass the post in exclude_list: {relative_path}")
+            sys.stdout.flush()
+            continue
+        if not (filename.endswith(".md") or is_media_file(filename)):  # 不需要处理的文件
+            continue
+
+        # 有强制翻译的标识时，即使已翻译过也重新翻译所有语言
+        source_hash, force, done_langs = source_index.lookup(input_file, relative_path, stat)
+        if not force and all(lang in done_langs for lang in targets):
+            # 源文件未变化，且所有语言都已确认翻译过，不需要读取翻译清单
+            skipped_files += 1
+            continue
+        pending_langs = [lang for lang in targets if force or (
+            lang not in done_langs and not manifest.is_up_to_date(relative_path, lang, source_hash))]
+        if not pending_langs:  # 所有语言都已按当前内容翻译过
+            skipped_files += 1
+        if not force:
+            source_index.mark_done(relative_path, [lang for lang in targets if lang not in pending_langs])
+        for lang in pending_langs:
+            jobs_to_translate.append((input_file, relative_path, lang, source_hash))
+    print(f"Pass {skipped_files} posts in manifest, {len(jobs_to_translate)} (file, language) jobs to translate "
+          f"(scanned in {time.monotonic() - scan_started_at:.2f}s)")
+    sys.stdout.flush()
+    return jobs_to_translate
+
+async def run_translation_round(jobs_to_translate: List[tuple], args) -> None:
+    """执行一轮翻译，结束后写回翻译清单和源文件索引，并输出本轮的指标和统计信息"""
+    global run_metrics
+    # 并发处理文件
+    run_metrics = RunMetrics(METRICS_DIR)
+    try:
+        if args.batch:
+            await run_batch_mode(jobs_to_translate, not args.no_incremental)
+        else:
+            await prefetch_front_matter(jobs_to_translate)
+            await process_files_async(jobs_to_translate, not args.no_incremental)
+    finally:
+        # 无论是否出错，都把已完成的翻译记录写回磁盘，并输出本次运行的指标
+        manifest.flush()
+        # 本轮没有被所有语言取走的多语言合并请求结果不再需要，守护模式下不会跨轮累积
+        multi_lang_requests.clear()
+        # 翻译清单写回后再保存源文件索引，记录的清单状态与磁盘上一致
+        source_index.save()
+        if run_metrics.records:
+            print(run_metrics.summary())
+            print(f"Metrics written to {run_metrics.jsonl_path} and {run_metrics.write_prometheus(backend_router.backends)}")
+            sys.stdout.flush()
+        run_metrics.close()
+    # 本轮全部成功且翻译清单已写回，分块日志中的记录都已体现在译文和快照中
+    chunk_journal.reset()
+
+    # 所有任务完成的提示
+    print("Congratulations! All files processed done.")
+    if translation_cache is not None:
+        print(translation_cache.stats())
+    for backend in backend_router.backends:
+        if ADAPTIVE_CONCURRENCY and backend.concurrency_limiter.baselines:
+            print(f"[{backend.name}] {backend.concurrency_limiter.stats()}")
+    if any(media_stats.values()):
+        print(f"Media files: {media_stats['copied']} copied, {media_stats['linked']} linked "
+              f"({media_strategy}), {media_stats['skipped']} already up to date")
+    if phrase_stats["lookups"] or phrase_stats["paragraphs"]:
+        hit_rate = phrase_stats["hits"] / phrase_stats["lookups"] * 100 if phrase_stats["lookups"] else 0.0
+        print(f"Phrase dictionary: {phrase_stats['hits']} of {phrase_stats['lookups']} segments resolved locally "
+              f"({hit_rate:.1f}% hit rate, saved up to {phrase_stats['hits']} API calls), "
+              f"{phrase_stats['paragraphs']} body paragraphs kept out of prompts")
+    if chunk_journal.replayed:
+        print(f"Chunk journal: {chunk_journal.replayed} chunks restored from the interrupted run")
+    if coalesce_stats["coalesced"]:
+        print(f"Coalesced {coalesce_stats['coalesced']} duplicate in-flight requests")
+    sys.stdout.flush()
+
+async def watch_and_translate(dir_to_translate: str, exclude_list: List[str], args) -> None:
+    """守护模式：监视源目录，文件保存后经过防抖只翻译改动过的文件，翻译客户端和连接在各轮之间复用"""
+    watcher = SourceWatcher(dir_to_translate, WATCH_POLL_INTERVAL)
+    print(f"Watching {dir_to_translate} for changes ({watcher.mode}), press Ctrl+C to stop")
+    sys.stdout.flush()
+    while True:
+        changed_paths = await watcher.wait_for_changes(WATCH_DEBOUNCE)
+        if changed_paths is None:
+            print("Change events were lost, rescanning the whole source directory")
+        else:
+            print(f"Detected changes in {len(changed_paths)} files")
+        sys.stdout.flush()
+        jobs_to_translate = collect_jobs(dir_to_translate, exclude_list, args.target, changed_paths)
+        if not jobs_to_translate:
+            # 只有删除或未实际改动的文件时，也要把索引的变化写回磁盘
+            source_index.save()
+            continue
+        try:
+            await run_translation_round(jobs_to_translate, args)
+        except Exception as e:
+            # 单轮失败不退出守护进程，失败的文件在下次保存或重启时重新翻译
+            print(f"An error has occurred: {e}")
+            sys.stdout.flush()
 
 async def main_async():
+    global client, translation_cache, manifest, source_index, chunk_journal, multi_lang_targets, stream_completions, \
+        media_strategy
     try:
         # 创建命令行参数解析器
         parser = argparse.ArgumentParser(description='自动翻译 Markdown 文件')
@@ -394,60 +1713,58 @@ async def main_async():
         parser.add_argument('target', nargs='+', help='目标语言代码列表 (例如: ja ko en)')
         parser.add_argument('--dir', default=DEFAULT_DIR_TO_TRANSLATE, help='要翻译的目录路径')
         parser.add_argument('--exclude', nargs='+', default=DEFAULT_EXCLUDE_LIST, help='要排除的文件列表')
+        parser.add_argument('--api-base', help='覆盖 env.py 中的 CHATGPT_API_BASE，例如指向本地的模拟服务')
+        parser.add_argument('--api-key', help='覆盖 env.py 中的 CHATGPT_API_KEY')
+        parser.add_argument('--no-cache', action='store_true', help='不使用本地翻译缓存')
+        parser.add_argument('--no-incremental', action='store_true', help='忽略上次翻译的快照，整篇重新翻译')
+        parser.add_argument('--stream', action='store_true', help='使用流式输出接收译文')
+        parser.add_argument('--batch', action='store_true', help='使用批量接口离线翻译，适合首次翻译整套课程；中断后重新运行会继续等待已提交的任务')
+        parser.add_argument('--media-strategy', choices=MEDIA_STRATEGIES, default=DEFAULT_MEDIA_STRATEGY,
+                            help='媒体文件的落盘方式：拷贝、硬链接、reflink 或符号链接，目标文件已一致时跳过')
+        parser.add_argument('--watch', action='store_true', help='翻译完成后继续监视源目录，文件保存后只翻译改动的文件')
+        parser.add_argument('--resume', action='store_true', help='回放上次中断的运行留下的分块日志，已完成的分块不再重新翻译')
+        parser.add_argument('--multi-lang', action='store_true', help='一次请求同时翻译为所有目标语言，解析失败时回退到逐语言请求')
         
         # 解析命令行参数
         args = parser.parse_args()
+        if args.watch and args.batch:
+            parser.error("--watch cannot be combined with --batch")
         
         # 设置工作目录和排除列表
         dir_to_translate = args.dir
         exclude_list = args.exclude
-        processed_list = DEFAULT_PROCESSED_LIST
+
+        stream_completions = args.stream
+        media_strategy = args.media_strategy
+        client = create_client(args.api_key or os.environ.get("CHATGPT_API_KEY"),
+                               args.api_base or os.environ.get("CHATGPT_API_BASE"))
+        if args.api_base or args.api_key:
+            # 指定了 API 地址或密钥时只使用这一个后端，忽略 BACKENDS
+            backend_router.backends = [create_backend("default", client, MODEL_CONFIG, rpm=RATE_LIMIT_RPM, tpm=RATE_LIMIT_TPM)]
+        else:
+            backend_router.backends = create_backends()
+
+        # 多语言合并请求只在有多个目标语言时才有意义，批量模式下按语言分别提交
+        if args.multi_lang and len(args.target) > 1 and not args.batch:
+            multi_lang_targets = list(args.target)
+
+        # 初始化本地翻译缓存
+        if not args.no_cache:
+            translation_cache = TranslationCache(TRANSLATION_CACHE_PATH, TRANSLATION_CACHE_MAX_BYTES)
         
         try:
-            # 创建一个外部列表文件，存放已处理的 Markdown 文件名列表
-            if not os.path.exists(processed_list):
-                with open(processed_list, "w", encoding="utf-8") as f:
-                    print("processed_list created")
-                    sys.stdout.flush()
+            # 一次性读入翻译清单，之后的跳过判断都在内存中完成
+            manifest = TranslationManifest(DEFAULT_MANIFEST, DEFAULT_PROCESSED_LIST, MANIFEST_FLUSH_EVERY,
+                                           get_output_file)
+            source_index = SourceIndex(SOURCE_INDEX_PATH, DEFAULT_MANIFEST, fingerprint_source)
+            chunk_journal = ChunkJournal(CHUNK_JOURNAL_PATH, args.resume)
 
-            # 读取已处理的文件列表
-            with open(processed_list, "r", encoding="utf-8") as f:
-                processed_list_content = f.read().splitlines()
-
-            # 收集需要翻译的文件
-            files_to_translate = []
-            for root, dirs, files in os.walk(dir_to_translate):
-                # 按文件名称顺序排序
-                sorted_files = sorted(files)
-                
-                for filename in sorted_files:
-                    # 获取相对路径
-                    relative_path = os.path.relpath(os.path.join(root, filename), dir_to_translate)
-                    input_file = os.path.join(root, filename)
-
-                    # 检查是否是以特定前缀开头的文件或目录
-                    path_parts = relative_path.split(os.sep)
-                    if any(part.startswith(('Course Info', 'Unit Info', 'Lesson Info')) for part in path_parts):
-                        # print(f"Pass the file with special prefix: {relative_path}")
-                        sys.stdout.flush()
-                        continue
+            jobs_to_translate = collect_jobs(dir_to_translate, exclude_list, args.target)
+            await run_translation_round(jobs_to_translate, args)
 
-                    if filename in exclude_list:  # 不进行翻译
-                        print(f"Pass the post in exclude_list: {relative_path}")
-                        sys.stdout.flush()
-                    elif relative_path in processed_list_content:  # 不进行翻译
-                        print(f"Pass the post in processed_list: {relative_path}")
-                        sys.stdout.flush()
-                    elif filename.endswith(".md") or is_media_file(filename):  # 需要处理的文件
-                        files_to_translate.append((input_file, relative_path))
-
-            # print(f"files_to_translate: {files_to_translate}")
-            # 并发处理文件
-            await process_files_async(files_to_translate, args.target)
-
-            # 所有任务完成的提示
-            print("Congratulations! All files processed done.")
-            sys.stdout.flush()
+            # 守护模式：保持进程和 HTTP 连接，源文件保存后只翻译改动的文件
+            if args.watch:
+                await watch_and_translate(dir_to_translate, exclude_list, args)
 
         except Exception as e:
             # 捕获异常并输出错误信息
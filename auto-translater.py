@@ -5,15 +5,23 @@ import sys
 import re
 import yaml  # pip install PyYAML
 import env
+from translation_cache import TranslationCache, make_cache_key
+from token_estimator import estimate_tokens, chunk_token_budget
+from replace_engine import ReplaceEngine
+from http_transport import create_http_client
 
 # 设置 OpenAI API Key 和 API Base 参数，通过 env.py 传入
+# 逐个请求顺序翻译，一个长连接即可，keep-alive 避免每次请求重新握手
 client = openai.OpenAI(
     api_key=os.environ.get("CHATGPT_API_KEY"),
-    base_url=os.environ.get("CHATGPT_API_BASE")
+    base_url=os.environ.get("CHATGPT_API_BASE"),
+    http_client=create_http_client(
+        max_connections=1, max_keepalive_connections=None, keepalive_expiry=60.0,
+        timeouts={"connect": 10.0, "read": 300.0, "write": 30.0, "pool": 60.0}, async_client=False)
 )
 
-# 设置最大输入字段，超出会拆分输入，防止超出输入字数限制
-max_length = 1800
+# 翻译缓存，重复的段落直接从本地读取，不再调用 API
+translation_cache = TranslationCache(".cache/translations.sqlite3", 512 * 1024 * 1024)
 
 # 设置翻译的路径
 dir_to_translate = "testdir/to-translate"
@@ -129,20 +137,39 @@ front_matter_replace_rules = [
 
 ##############################
 
+# 把替换规则编译为替换引擎，每次替换只需扫描一遍文本。原文重复时以靠前的规则为准
+replace_rule_placeholders = {}
+for i, rule in enumerate(replace_rules):
+    replace_rule_placeholders.setdefault(rule["orginal_text"], f"[to_be_replace[{i + 1}]]")
+replace_rule_masker = ReplaceEngine(replace_rule_placeholders)
+replace_rule_unmaskers = {
+    lang: ReplaceEngine({f"[to_be_replace[{i + 1}]]": rule["replaced_text"][lang] for i, rule in enumerate(replace_rules)})
+    for lang in dir_translated
+}
+front_matter_replacers = {
+    lang: ReplaceEngine({rule["orginal_text"]: rule["replaced_text"][lang] for rule in reversed(front_matter_replace_rules)})
+    for lang in dir_translated
+}
+
 # 对 Front Matter 使用固定规则替换的函数
 def front_matter_replace(value, lang):
     for index in range(len(value)):
-        element = value[index]
-        # print(f"element[{index}] = {element}")
-        for replacement in front_matter_replace_rules:
-            if replacement["orginal_text"] in element:
-                # 使用 replace 函数逐个替换
-                element = element.replace(
-                    replacement["orginal_text"], replacement["replaced_text"][lang])
-        value[index] = element
-        # print(f"element[{index}] = {element}")
+        value[index] = front_matter_replacers[lang].replace(value[index])
     return value
 
+# 翻译使用的模型
+translation_model = "gpt-3.5-turbo"
+
+# Front Matter 与正文内容使用不同的 prompt 翻译
+system_prompts = {
+    "front-matter": "You are a professional translation engine, please translate the text into a colloquial, professional, elegant and fluent content, without the style of machine translation. You must only translate the text content, never interpret it.",
+    "main-body": "You are a professional translation engine, please translate the text into a colloquial, professional, elegant and fluent content, without the style of machine translation. You must maintain the original markdown format. You must not translate the `[to_be_replace[x]]` field.You must only translate the text content, never interpret it."
+}
+
+# 单个分块的原文 token 预算，超出会拆分输入。gpt-3.5-turbo 的上下文窗口为 16385，最大输出为 4096，
+# 译文按原文的 1.5 倍预留空间
+max_chunk_tokens = chunk_token_budget(16385, 4096, estimate_tokens(system_prompts["main-body"]) + 50, 1.5)
+
 # 定义调用 ChatGPT API 翻译的函数
 def translate_text(text, lang, type):
     target_lang = {
@@ -150,30 +177,27 @@ def translate_text(text, lang, type):
         "es": "Spanish",
         "ar": "Arabic"
     }[lang]
-    
-    # Front Matter 与正文内容使用不同的 prompt 翻译
-    # 翻译 Front Matter。
-    if type == "front-matter":
-        completion = client.chat.completions.create(
-            # todo syj 替换 Model
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a professional translation engine, please translate the text into a colloquial, professional, elegant and fluent content, without the style of machine translation. You must only translate the text content, never interpret it."},
-                {"role": "user", "content": f"Translate into {target_lang}:\n\n{text}\n"},
-            ],
-        )  
-    # 翻译正文
-    elif type== "main-body":
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a professional translation engine, please translate the text into a colloquial, professional, elegant and fluent content, without the style of machine translation. You must maintain the original markdown format. You must not translate the `[to_be_replace[x]]` field.You must only translate the text content, never interpret it."},
-                {"role": "user", "content": f"Translate into {target_lang}:\n\n{text}\n"},
-            ],
-        )
+
+    # 先查询本地缓存，命中则跳过 API 调用
+    cache_key = make_cache_key(text, lang, translation_model, system_prompts[type])
+    cached_text = translation_cache.get(cache_key)
+    if cached_text is not None:
+        return cached_text
+
+    completion = client.chat.completions.create(
+        # todo syj 替换 Model
+        model=translation_model,
+        messages=[
+            {"role": "system", "content": system_prompts[type]},
+            {"role": "user", "content": f"Translate into {target_lang}:\n\n{text}\n"},
+        ],
+    )
 
     # 获取翻译结果
     output_text = completion.choices[0].message.content
+
+    # 写入缓存，下次遇到相同的段落时直接复用
+    translation_cache.put(cache_key, output_text)
     return output_text
 
 # Front Matter 处理规则
@@ -190,31 +214,33 @@ def translate_front_matter(front_matter, lang):
     return translated_front_matter
 
 # 定义文章拆分函数
-def split_text(text, max_length):
+def split_text(text, max_tokens):
     # 根据段落拆分文章
     paragraphs = text.split("\n\n")
     output_paragraphs = []
     current_paragraph = ""
+    current_tokens = 0
 
     for paragraph in paragraphs:
-        if len(current_paragraph) + len(paragraph) + 2 <= max_length:
-            # 如果当前段落加上新段落的长度不超过最大长度，就将它们合并
+        # 段落之间的空行大约占一个 token
+        paragraph_tokens = estimate_tokens(paragraph) + 1
+        if not current_paragraph or current_tokens + paragraph_tokens <= max_tokens:
+            # 如果当前段落加上新段落的 token 数不超过预算，就将它们合并
             if current_paragraph:
                 current_paragraph += "\n\n"
             current_paragraph += paragraph
+            current_tokens += paragraph_tokens
         else:
             # 否则将当前段落添加到输出列表中，并重新开始一个新段落
             output_paragraphs.append(current_paragraph)
             current_paragraph = paragraph
+            current_tokens = paragraph_tokens
 
     # 将最后一个段落添加到输出列表中
     if current_paragraph:
         output_paragraphs.append(current_paragraph)
 
-    # 将输出段落合并为字符串
-    output_text = "\n\n".join(output_paragraphs)
-
-    return output_text
+    return output_paragraphs
 
 # 定义翻译文件的函数
 def translate_file(input_file, filename, lang):
@@ -232,16 +258,8 @@ def translate_file(input_file, filename, lang):
     with open(input_file, "r", encoding="utf-8") as f:
         input_text = f.read()
 
-    # 创建一个字典来存储占位词和对应的替换文本
-    placeholder_dict = {}
-
-    # 使用 for 循环应用替换规则，并将匹配的文本替换为占位词
-    for i, rule in enumerate(replace_rules):
-        find_text = rule["orginal_text"]
-        replace_with = rule["replaced_text"][lang]
-        placeholder = f"[to_be_replace[{i + 1}]]"
-        input_text = input_text.replace(find_text, placeholder)
-        placeholder_dict[placeholder] = replace_with
+    # 一次扫描将替换规则中的固定文本全部替换为占位词
+    input_text = replace_rule_masker.replace(input_text)
 
     # 删除译文中指示强制翻译的 marker
     input_text = input_text.replace(marker_force_translate, "")
@@ -273,35 +291,10 @@ def translate_file(input_file, filename, lang):
 
     # print(input_text) # debug 用，看看输入的是什么
 
-    # 拆分文章
-    paragraphs = input_text.split("\n\n")
-    input_text = ""
+    # 按 token 预算拆分文章，逐块翻译
     output_paragraphs = []
-    current_paragraph = ""
-
-    for paragraph in paragraphs:
-        if len(current_paragraph) + len(paragraph) + 2 <= max_length:
-            # 如果当前段落加上新段落的长度不超过最大长度，就将它们合并
-            if current_paragraph:
-                current_paragraph += "\n\n"
-            current_paragraph += paragraph
-        else:
-            # 否则翻译当前段落，并将翻译结果添加到输出列表中
-            output_paragraphs.append(translate_text(current_paragraph, lang,"main-body"))
-            current_paragraph = paragraph
-
-    # 处理最后一个段落
-    if current_paragraph:
-        if len(current_paragraph) + len(input_text) <= max_length:
-            # 如果当前段落加上之前的文本长度不超过最大长度，就将它们合并
-            input_text += "\n\n" + current_paragraph
-        else:
-            # 否则翻译当前段落，并将翻译结果添加到输出列表中
-            output_paragraphs.append(translate_text(current_paragraph, lang,"main-body"))
-
-    # 如果还有未翻译的文本，就将它们添加到输出列表中
-    if input_text:
-        output_paragraphs.append(translate_text(input_text, lang,"main-body"))
+    for chunk in split_text(input_text, max_chunk_tokens):
+        output_paragraphs.append(translate_text(chunk, lang, "main-body"))
 
     # 将输出段落合并为字符串
     output_text = "\n\n".join(output_paragraphs)
@@ -318,9 +311,8 @@ def translate_file(input_file, filename, lang):
     elif lang == "ar":
         output_text = output_text + tips_translated_by_chatgpt["ar"]
 
-    # 最后，将占位词替换为对应的替换文本
-    for placeholder, replacement in placeholder_dict.items():
-        output_text = output_text.replace(placeholder, replacement)
+    # 最后，一次扫描将占位词替换为对应的替换文本
+    output_text = replace_rule_unmaskers[lang].replace(output_text)
 
     # 写入输出文件
     with open(output_file, "w", encoding="utf-8") as f:
@@ -388,6 +380,7 @@ try:
             
     # 所有任务完成的提示
     print("Congratulations! All files processed done.")
+    print(translation_cache.stats())
     sys.stdout.flush()
 
 except Exception as e:
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from collections import deque
+from typing import Dict, List
+
+from circuit_breaker import CircuitBreaker
+from concurrency_limiter import AdaptiveConcurrencyLimiter
+from rate_limiter import TokenBucketRateLimiter
+from run_metrics import percentile
+
+
+class Backend:
+    """一个 OpenAI 兼容的翻译后端，有自己的客户端、模型、价格、限流器、并发控制器和熔断器
+
+    models 为提示词类型到模型名的映射，没有列出的提示词类型不会发送到这个后端。
+    pricing 为各模型每百万 token 的价格，没有价格的模型在选择后端时排在最后。
+    latency_targets 为各提示词类型的 p95 延迟目标（秒），按最近 latency_window 个成功请求计算。
+    """
+
+    def __init__(self, name: str, client, models: Dict[str, str], rate_limiter: TokenBucketRateLimiter,
+                 circuit_breaker: CircuitBreaker, concurrency_limiter: AdaptiveConcurrencyLimiter,
+                 pricing: Dict[str, Dict[str, float]] = None, latency_targets: Dict[str, float] = None,
+                 latency_window: int = 50):
+        self.name = name
+        self.client = client
+        self.models = models
+        self.pricing = pricing or {}
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
+        self.concurrency_limiter = concurrency_limiter
+        self.latency_targets = latency_targets or {}
+        self.latency_window = latency_window
+        # 各提示词类型最近成功请求的延迟，用于判断是否满足延迟目标
+        self.recent_latencies = {}
+
+    def get_pricing(self, model: str):
+        return self.pricing.get(model)
+
+    def get_price(self, type: str) -> float:
+        """该提示词类型每百万输入和输出 token 的价格之和，用于比较各后端的价格。没有价格的模型排在最后"""
+        pricing = self.get_pricing(self.models[type])
+        if pricing is None:
+            return float("inf")
+        return pricing["input"] + pricing["output"]
+
+    def is_available(self) -> bool:
+        """熔断器关闭，或冷却已经结束、可以放行探测请求"""
+        breaker = self.circuit_breaker
+        return breaker.opened_at is None or (
+            not breaker.probing and time.monotonic() >= breaker.opened_at + breaker.cooldown)
+
+    def has_capacity(self) -> bool:
+        return self.concurrency_limiter.in_flight < self.concurrency_limiter.current_limit
+
+    def load(self) -> float:
+        """进行中和排队等待的请求数相对于当前并发上限的比例"""
+        limiter = self.concurrency_limiter
+        return (limiter.in_flight + len(limiter.waiters)) / max(1, limiter.current_limit)
+
+    def latency_p95(self, type: str) -> float:
+        return percentile(list(self.recent_latencies.get(type, ())), 95)
+
+    def meets_latency_target(self, type: str) -> bool:
+        """最近的样本不足 5 个时视为满足延迟目标"""
+        latencies = self.recent_latencies.get(type, ())
+        return len(latencies) < 5 or self.latency_p95(type) <= self.latency_targets.get(type, float("inf"))
+
+    def record_latency(self, type: str, latency: float) -> None:
+        self.recent_latencies.setdefault(type, deque(maxlen=self.latency_window)).append(latency)
+
+
+class BackendRouter:
+    """为每个请求选择后端：在健康且满足延迟目标的后端中优先选择价格最低、仍有空闲并发名额的一个
+
+    价格最低的后端并发名额用满时溢出到下一个后端，多个后端的吞吐量可以叠加；都用满时等待任意一个后端空出名额后重新选择。
+    都不满足延迟目标时选择延迟最低的健康后端，都在熔断时等待最先结束冷却的一个。
+    """
+
+    def __init__(self, backends: List[Backend]):
+        self.waiters = []
+        self.backends = backends
+
+    @property
+    def backends(self) -> List[Backend]:
+        return self._backends
+
+    @backends.setter
+    def backends(self, backends: List[Backend]) -> None:
+        self._backends = backends
+        for backend in backends:
+            backend.concurrency_limiter.on_release = self._wake_waiters
+
+    def _wake_waiters(self) -> None:
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def acquire(self, type: str, excluded=()) -> Backend:
+        """选择后端；选中的后端没有空闲名额时，等待任意一个后端空出名额后重新选择，避免在单个后端排队"""
+        while True:
+            backend = self.select(type, excluded)
+            if backend.has_capacity() or not backend.is_available():
+                return backend
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                self.waiters.remove(waiter)
+
+    def select(self, type: str, excluded=()) -> Backend:
+        """excluded 为本次调用中已经失败过的后端，还有其他后端可用时不再选择"""
+        candidates = [b for b in self.backends if type in b.models]
+        candidates = [b for b in candidates if b not in excluded] or candidates
+        healthy = [b for b in candidates if b.is_available()]
+        if not healthy:
+            return min(candidates, key=lambda b: b.circuit_breaker.opened_at + b.circuit_breaker.cooldown)
+        fast = sorted((b for b in healthy if b.meets_latency_target(type)), key=lambda b: b.get_price(type))
+        if not fast:
+            return min(healthy, key=lambda b: b.latency_p95(type))
+        for backend in fast:
+            if backend.has_capacity():
+                return backend
+        return min(fast, key=lambda b: b.load())
+
+    def has_alternative(self, type: str, excluded) -> bool:
+        """除了 excluded 之外是否还有可用的后端，有则失败后立即切换，不需要退避等待"""
+        return any(type in b.models and b not in excluded and b.is_available() for b in self.backends)
+
+    @property
+    def total_concurrency_limit(self) -> int:
+        return sum(b.concurrency_limiter.current_limit for b in self.backends)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import sys
+
+
+def hash_text(text: str) -> str:
+    """计算分块原文的哈希值"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkJournal:
+    """只追加的分块日志，每翻译完一个分块追加一条 (文件, 语言, 分块序号, 源文件哈希) → (译文, 模型) 的记录
+
+    进程中断后用 --resume 重新运行时先回放日志，已完成的分块不再调用 API，只需重新翻译中断时进行中的分块。
+    记录同时保存分块原文的哈希，源文件或分块边界变化后旧记录自动失效。一轮翻译全部成功后清空日志。
+    """
+
+    def __init__(self, path: str, resume: bool):
+        self.path = path
+        self.entries = {}
+        self.replayed = 0
+        journal_dir = os.path.dirname(path)
+        if journal_dir and not os.path.exists(journal_dir):
+            os.makedirs(journal_dir)
+        needs_newline = resume and self._replay()
+        # 不恢复时丢弃上次运行留下的日志
+        self.file = open(path, "a" if resume else "w", encoding="utf-8")
+        if needs_newline:
+            # 上次运行在写入一行的中途被终止，补上换行，避免新记录接在残缺的行后面
+            self.file.write("\n")
+
+    def _replay(self) -> bool:
+        """读入已有的日志，返回最后一行是否残缺（没有换行）"""
+        if not os.path.exists(self.path):
+            return False
+        last_line = ""
+        with open(self.path, "r", encoding="utf-8") as f:
+            for last_line in f:
+                try:
+                    record = json.loads(last_line)
+                except ValueError:
+                    continue
+                self.entries[(record["path"], record["lang"], record["chunk"])] = (
+                    record["source_hash"], record["chunk_hash"], record["translation"], record.get("model"))
+        if self.entries:
+            print(f"Resuming from chunk journal: {len(self.entries)} completed chunks")
+            sys.stdout.flush()
+        return bool(last_line) and not last_line.endswith("\n")
+
+    def lookup(self, relative_path: str, lang: str, index: int, source_hash: str, chunk_text: str):
+        """返回日志中该分块的 (译文, 模型)，源文件或分块原文变化时返回 None"""
+        entry = self.entries.get((relative_path, lang, index))
+        if entry is None or entry[0] != source_hash or entry[1] != hash_text(chunk_text):
+            return None
+        self.replayed += 1
+        return entry[2], entry[3]
+
+    def append(self, relative_path: str, lang: str, index: int, source_hash: str, chunk_text: str,
+               translation: str, model) -> None:
+        record = {"path": relative_path, "lang": lang, "chunk": index, "source_hash": source_hash,
+                  "chunk_hash": hash_text(chunk_text), "translation": translation, "model": model}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # 每条记录立即写入，进程被终止时已完成的分块不会丢失
+        self.file.flush()
+
+    def reset(self) -> None:
+        """一轮翻译全部成功后清空日志"""
+        self.file.seek(0)
+        self.file.truncate()
+        self.entries.clear()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import sys
+import time
+
+
+class CircuitBreaker:
+    """熔断器，连续失败达到阈值后暂停派发请求，冷却结束后放行一个探测请求
+
+    探测成功则恢复正常，失败则重新进入冷却。
+    """
+
+    def __init__(self, threshold: int, cooldown: float, name: str = "default"):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    async def wait_until_closed(self) -> bool:
+        """熔断期间等待冷却结束，半开状态下只放行一个探测请求。返回本次放行的是否为探测请求"""
+        while self.opened_at is not None:
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            elif not self.probing:
+                self.probing = True
+                return True
+            else:
+                await asyncio.sleep(1)
+        return False
+
+    def end_probe(self) -> None:
+        """探测请求结束。没有通过 record_success 或 record_failure 得出结论时，允许下一个请求继续探测"""
+        self.probing = False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            print(f"Circuit breaker closed, backend {self.name} recovered")
+            sys.stdout.flush()
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.probing or (self.opened_at is None and self.consecutive_failures >= self.threshold):
+            print(f"Circuit breaker for backend {self.name} opened after {self.consecutive_failures} consecutive failures, "
+                  f"pausing requests for {self.cooldown}s")
+            sys.stdout.flush()
+            self.opened_at = time.monotonic()
+            self.probing = False
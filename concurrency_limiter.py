@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+
+class AdaptiveConcurrencyLimiter:
+    """按 AIMD（加性增、乘性减）自动调整同时进行中的 API 请求数
+
+    并发名额用满且请求健康时，每完成 limit 个请求上限加 1；遇到 429、503、超时或延迟突增时上限乘以 decrease_factor。
+    第一次过载之前处于慢启动阶段，每完成一个请求上限加 1，尽快找到服务端能承受的并发。
+    延迟按每个输出 token 的耗时计算，并按提示词类型分别维护基线，避免长短不同的请求互相干扰。
+    同一时刻发出的请求往往一起失败，在上次下调之前派发的请求失败不会再次下调。
+    adaptive 为 False 时上限固定为 initial，等同于普通信号量。
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, decrease_factor: float,
+                 latency_tolerance: float, adaptive: bool = True):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.adaptive = adaptive
+        self.in_flight = 0
+        self.waiters = []
+        # 有名额空出时的回调，后端路由用它唤醒等待任意后端的请求
+        self.on_release = None
+        # 各提示词类型每个输出 token 耗时的指数移动平均和样本数
+        self.baselines = {}
+        self.last_decrease_at = 0.0
+        self.slow_start = True
+        self.increases = 0
+        self.decreases = 0
+        self.lowest = self.highest = int(self.limit)
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    async def acquire(self) -> float:
+        """等待空闲的并发名额，返回派发时间"""
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                self.waiters.remove(waiter)
+        self.in_flight += 1
+        return time.monotonic()
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        # 唤醒所有等待者重新检查名额，被唤醒后取消的等待者不会占用名额
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        if self.on_release is not None:
+            self.on_release()
+
+    def _is_latency_spike(self, type: str, latency: float, completion_tokens: int) -> bool:
+        """与该类型的基线相比，每个输出 token 的耗时是否超过容忍倍数。基线缓慢跟随，突增的样本按上限计入"""
+        sample = latency / (completion_tokens + 1)
+        average, count = self.baselines.get(type, (sample, 0))
+        spike = count >= 10 and sample > average * self.latency_tolerance
+        average += 0.05 * (min(sample, average * self.latency_tolerance) - average)
+        self.baselines[type] = (average, count + 1)
+        return spike
+
+    def record_success(self, type: str, dispatched_at: float, latency: float, completion_tokens: int,
+                       in_flight: int) -> None:
+        """记录一次成功的请求。in_flight 为派发时的并发请求数，名额没有用满时不增加上限"""
+        if not self.adaptive:
+            return
+        if self._is_latency_spike(type, latency, completion_tokens):
+            self.record_overload(dispatched_at)
+        elif in_flight >= int(self.limit) and self.limit < self.maximum:
+            previous = int(self.limit)
+            self.limit = min(self.maximum, self.limit + (1 if self.slow_start else 1 / self.limit))
+            if int(self.limit) > previous:
+                self.increases += 1
+                self.highest = max(self.highest, int(self.limit))
+                self._wake_waiters()
+
+    def record_overload(self, dispatched_at: float) -> None:
+        """服务端过载（429、503、超时或延迟突增）时乘性下调上限"""
+        if not self.adaptive or dispatched_at < self.last_decrease_at:
+            return
+        self.limit = max(float(self.minimum), self.limit * self.decrease_factor)
+        self.slow_start = False
+        self.last_decrease_at = time.monotonic()
+        self.decreases += 1
+        self.lowest = min(self.lowest, int(self.limit))
+
+    def stats(self) -> str:
+        return (f"Adaptive concurrency: limit {self.current_limit} (range {self.lowest}-{self.highest} since start, "
+                f"{self.increases} increases, {self.decreases} decreases)")
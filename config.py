@@ -43,11 +43,104 @@ MODEL_CONFIG = {
     "main-body": "deepseek-chat"
 }
 
-# 最大输入长度
-MAX_LENGTH = 8000
+# 翻译后端列表，每个后端是一个 OpenAI 兼容的接口，有自己的模型、价格、限流和并发上限，路由为每个请求选择后端。
+# 为空时只使用 env.py 中的 CHATGPT_API_BASE 和 MODEL_CONFIG。每个后端的设置：
+#   name：后端名称，用于日志和指标
+#   api_base：接口地址；api_key_env：保存 API Key 的环境变量名（可在 env.py 中设置）
+#   models：提示词类型到模型名的映射，默认为 MODEL_CONFIG，没有列出的提示词类型不会发送到这个后端
+#   pricing：可选，各模型每百万 token 的价格，默认使用 MODEL_PRICING
+#   rpm / tpm：可选，该后端的速率限制；max_concurrency：可选，该后端的并发上限，默认为 ADAPTIVE_CONCURRENCY_MAX
+# 例如：
+# BACKENDS = [
+#     {"name": "deepseek", "api_base": "https://api.deepseek.com/v1", "api_key_env": "DEEPSEEK_API_KEY"},
+#     {"name": "openai", "api_base": "https://api.openai.com/v1", "api_key_env": "OPENAI_API_KEY",
+#      "models": {"front-matter": "gpt-4o-mini", "main-body": "gpt-4o-mini"}, "rpm": 500, "max_concurrency": 16},
+# ]
+BACKENDS = []
+# 路由的延迟目标（秒）：后端最近请求的 p95 延迟超过目标时，只在没有其他满足目标的后端时才使用
+ROUTER_LATENCY_TARGETS = {"front-matter": 20.0, "main-body": 120.0}
+# 计算 p95 延迟使用的最近请求数
+ROUTER_LATENCY_WINDOW = 50
+
+# 各模型每百万 token 的价格（美元），用于估算每次请求的费用。cached_input 为命中服务端缓存的输入价格
+MODEL_PRICING = {
+    "deepseek-chat": {"input": 0.27, "cached_input": 0.07, "output": 1.10},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+}
+
+# 每次运行的请求指标（JSONL）和 Prometheus 文本格式指标的输出目录
+METRICS_DIR = "metrics"
+
+# 批量模式（--batch）的设置：中间文件和任务状态目录、轮询间隔（秒）、单个批量任务的最大请求数
+BATCH_DIR = ".batch"
+BATCH_POLL_INTERVAL = 60
+BATCH_MAX_REQUESTS = 50000
+
+# 各模型的上下文窗口和最大输出 token 数，用于按 token 预算拆分文章
+MODEL_TOKEN_LIMITS = {
+    "deepseek-chat": {"context": 65536, "max_output": 8192},
+    "gpt-4o-mini": {"context": 128000, "max_output": 16384},
+}
+# 未在 MODEL_TOKEN_LIMITS 中列出的模型使用的保守默认值
+DEFAULT_MODEL_TOKEN_LIMITS = {"context": 16384, "max_output": 4096}
+# 译文 token 数相对原文 token 数的估计倍数，用于给输出预留空间
+OUTPUT_TOKEN_RATIO = 1.5
+# 单个分块的原文 token 数上限。分块过大时翻译质量下降，也不利于分块并发翻译
+MAX_CHUNK_TOKENS = 4000
+# 估算任务耗时时，每次请求的固定开销（首个 token 的延迟等）折算成的输出 token 数，用于安排任务的派发顺序
+SCHEDULER_REQUEST_OVERHEAD_TOKENS = 200
+
+# Front Matter 字段跨文件打包翻译时，每个请求最多包含的字段值数量
+FRONT_MATTER_BATCH_SIZE = 40
 
 # 并发设置
-MAX_CONCURRENT_FILES = 10
+# 同时处理的 (文件, 语言) 任务数。实际的 API 并发由下面的并发控制器决定，这里只需不小于 ADAPTIVE_CONCURRENCY_MAX，
+# 保证有足够的任务让并发升上去
+MAX_CONCURRENT_FILES = 32
+# 同时处理的媒体文件数，媒体文件使用单独的 I/O 通道，不占用翻译任务的并发名额
+MAX_CONCURRENT_MEDIA = 4
+# 媒体文件的默认落盘方式：copy、hardlink、reflink 或 symlink
+DEFAULT_MEDIA_STRATEGY = "copy"
+# 同时进行中的 API 请求数，同一文件的多个分块会并发翻译，共享这一上限。启用自适应并发时为初始上限
+MAX_CONCURRENT_REQUESTS = 10
+# 自适应并发（AIMD）：并发名额用满且请求健康时逐步加 1，遇到 429、503、超时或延迟突增时乘以下调系数
+ADAPTIVE_CONCURRENCY = True
+# 自适应并发的上下限
+ADAPTIVE_CONCURRENCY_MIN = 1
+ADAPTIVE_CONCURRENCY_MAX = 32
+# 过载时的下调系数
+ADAPTIVE_CONCURRENCY_DECREASE_FACTOR = 0.5
+# 每个输出 token 的耗时超过基线的多少倍时视为延迟突增
+ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE = 2.0
+
+# HTTP 连接池设置，正文、Front Matter 等所有 API 调用共用一个连接池
+# 连接池的最大连接数，None 表示与并发上限相同（启用自适应并发时为 ADAPTIVE_CONCURRENCY_MAX），放行的请求不会再在连接池中排队
+HTTP_MAX_CONNECTIONS = None
+# 保留的空闲连接数，None 表示与最大连接数相同
+HTTP_MAX_KEEPALIVE_CONNECTIONS = None
+# 空闲连接保留的秒数
+HTTP_KEEPALIVE_EXPIRY = 60.0
+# 是否启用 HTTP/2 多路复用，需要安装 h2（pip install "httpx[http2]"），未安装时回退为 HTTP/1.1
+HTTP2 = False
+# 分阶段超时（秒）：建立连接、读取响应（流式输出时为两个数据块之间的间隔）、发送请求、等待连接池
+HTTP_TIMEOUTS = {"connect": 10.0, "read": 300.0, "write": 30.0, "pool": 60.0}
+
+# 服务商的速率限制，按每分钟请求数 (RPM) 和每分钟 token 数 (TPM) 计量，None 表示不限制
+RATE_LIMIT_RPM = None
+RATE_LIMIT_TPM = None
+
+# 重试设置：限流、超时、连接失败和服务端错误会按带抖动的指数退避重试
+MAX_RETRIES = 6
+# 退避的基础等待时间和最大等待时间（秒）
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+# 重试预算：整个运行期间最多允许 RETRY_BUDGET_MIN + 请求数 * RETRY_BUDGET_RATIO 次重试
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MIN = 20
+
+# 熔断设置：连续失败达到阈值后暂停派发请求，冷却一段时间（秒）后再探测
+CIRCUIT_BREAKER_THRESHOLD = 5
+CIRCUIT_BREAKER_COOLDOWN = 30.0
 
 # 支持的语言列表
 SUPPORTED_LANGUAGES = {
@@ -59,10 +152,47 @@ SUPPORTED_LANGUAGES = {
     "zh": "Chinese"
 }
 
+# 短语词典：完全由词典中的短语组成的片段（如标题、标签、固定的小节名）直接在本地替换，不调用 API。
+# 键为原文短语，值为各语言的译文；缺少某种语言时该语言仍走正常的翻译流程
+PHRASE_DICTIONARY = {
+    "内容": {"en": "Content", "es": "Contenido", "ar": "المحتوى", "ja": "内容", "ko": "내용"},
+    "测验": {"en": "Quiz", "es": "Cuestionario", "ar": "اختبار", "ja": "クイズ", "ko": "퀴즈"},
+    "提示": {"en": "Hint", "es": "Pista", "ar": "تلميح", "ja": "ヒント", "ko": "힌트"},
+    "示例": {"en": "Example", "es": "Ejemplo", "ar": "مثال", "ja": "例", "ko": "예시"},
+    "练习": {"en": "Exercise", "es": "Ejercicio", "ar": "تمرين", "ja": "演習", "ko": "연습"},
+    "总结": {"en": "Summary", "es": "Resumen", "ar": "ملخص", "ja": "まとめ", "ko": "요약"},
+    "参考资料": {"en": "References", "es": "Referencias", "ar": "المراجع", "ja": "参考資料", "ko": "참고 자료"},
+}
+
 # 默认配置
 DEFAULT_DIR_TO_TRANSLATE = "testdir/to-translate"
 DEFAULT_EXCLUDE_LIST = ["index.md", "Contact-and-Subscribe.md", "WeChat.md"]
+# 旧版的已处理文件列表，仅用于首次运行时迁移到翻译清单
 DEFAULT_PROCESSED_LIST = "processed_list.txt"
+# 翻译清单，以 (相对路径, 语言) 为键记录源文件哈希、译文哈希、模型和翻译时间
+DEFAULT_MANIFEST = "translation_manifest.json"
+# 翻译清单每累积多少条更新写回一次磁盘
+MANIFEST_FLUSH_EVERY = 20
+# 源文件索引，记录每个 Markdown 文件的大小、修改时间和内容哈希，未变化的文件扫描时不需要读取
+SOURCE_INDEX_PATH = ".cache/source_index.json"
+
+# 守护模式（--watch）：文件保存后等待多少秒没有新的变化才开始翻译，以及 inotify 不可用时的轮询间隔
+WATCH_DEBOUNCE = 2.0
+WATCH_POLL_INTERVAL = 5.0
+
+# 即使在已处理的列表中，仍需要重新翻译的标记
+MARKER_FORCE_TRANSLATE = "\n[translate]\n"
+
+# 翻译快照目录，保存每个文件上次翻译的原文分块和译文，重新翻译时只翻译改动过的分块
+SNAPSHOT_DIR = ".i18n_snapshots"
+
+# 分块日志：每翻译完一个分块追加一条记录，进程中断后使用 --resume 重新运行时不需要重新翻译已完成的分块
+CHUNK_JOURNAL_PATH = ".cache/chunk_journal.jsonl"
+
+# 翻译缓存：以原文、目标语言、模型和提示词的哈希为键，重复的段落直接从本地读取
+TRANSLATION_CACHE_PATH = ".cache/translations.sqlite3"
+# 缓存容量上限（字节），超出后淘汰最久未访问的条目
+TRANSLATION_CACHE_MAX_BYTES = 512 * 1024 * 1024
 
 # 设置翻译的路径
 DIR_TRANSLATED = {
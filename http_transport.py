@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""翻译脚本共用的 HTTP 传输层：可配置的连接池、keep-alive、HTTP/2 和分阶段超时，并统计连接池等待时间
+
+连接池等待时间通过 httpcore 的 trace 扩展获得：从请求发出到开始建立新连接（或复用连接开始发送请求头）之间的时间。
+"""
+import time
+import contextvars
+from typing import Dict, Optional
+import openai
+try:
+    import httpx  # openai 1.x 使用的 HTTP 库
+except ImportError:
+    import httpx2 as httpx  # 新版 openai 改用接口相同的 httpx2
+
+# 当前 API 调用的 HTTP 各阶段耗时。调用方为每次调用设置一个字典，trace 回调把耗时写进去
+current_http_timings = contextvars.ContextVar("current_http_timings", default=None)
+
+# 表示连接已经从连接池中取得的 trace 事件：新建连接时先建立 TCP 连接，复用连接时直接发送请求头
+CONNECT_EVENTS = (".connect_tcp.started", ".connect_unix_socket.started")
+SEND_EVENTS = (".send_request_headers.started", ".send_connection_init.started")
+CONNECTED_EVENTS = (".connect_tcp.complete", ".connect_unix_socket.complete", ".start_tls.complete")
+
+
+def is_http2_available() -> bool:
+    """HTTP/2 需要安装 h2（pip install "httpx[http2]"）"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HttpTimingTracer:
+    """记录一个请求在连接池中的等待时间，以及新建连接的耗时"""
+
+    def __init__(self, timings: Dict[str, float]):
+        self.timings = timings
+        self.started_at = time.monotonic()
+        self.connect_started_at = None
+
+    def on_event(self, event_name: str) -> None:
+        now = time.monotonic()
+        if "pool_wait" not in self.timings and event_name.endswith(CONNECT_EVENTS + SEND_EVENTS):
+            self.timings["pool_wait"] = now - self.started_at
+            self.timings["new_connection"] = event_name.endswith(CONNECT_EVENTS)
+        if event_name.endswith(CONNECT_EVENTS):
+            self.connect_started_at = now
+        elif event_name.endswith(CONNECTED_EVENTS) and self.connect_started_at is not None:
+            self.timings["connect_time"] = now - self.connect_started_at
+
+
+def attach_tracer(request) -> None:
+    """当前调用设置了耗时字典时，为请求挂上 trace 回调。重试会重新发出请求，只保留最后一次的耗时"""
+    timings = current_http_timings.get()
+    if timings is None:
+        return
+    timings.clear()
+    tracer = HttpTimingTracer(timings)
+    request.extensions["trace"] = lambda event_name, info: tracer.on_event(event_name)
+
+
+async def attach_tracer_async(request) -> None:
+    timings = current_http_timings.get()
+    if timings is None:
+        return
+    timings.clear()
+    tracer = HttpTimingTracer(timings)
+
+    async def trace(event_name, info):
+        tracer.on_event(event_name)
+    request.extensions["trace"] = trace
+
+
+def create_http_client(max_connections: int, max_keepalive_connections: Optional[int], keepalive_expiry: float,
+                       timeouts: Dict[str, float], http2: bool = False, async_client: bool = True):
+    """创建 openai 客户端使用的 HTTP 客户端，所有调用共用同一个连接池
+
+    max_keepalive_connections 为 None 时与 max_connections 相同，空闲连接全部保留，避免突发请求时重新握手。
+    要求 HTTP/2 但没有安装 h2 时回退为 HTTP/1.1。
+    """
+    if http2 and not is_http2_available():
+        print('HTTP/2 requires the h2 package (pip install "httpx[http2]"), falling back to HTTP/1.1')
+        http2 = False
+    kwargs = {
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections or max_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        "timeout": httpx.Timeout(
+            connect=timeouts["connect"], read=timeouts["read"], write=timeouts["write"], pool=timeouts["pool"]),
+        "http2": http2,
+    }
+    if async_client:
+        return openai.DefaultAsyncHttpxClient(event_hooks={"request": [attach_tracer_async]}, **kwargs)
+    return openai.DefaultHttpxClient(event_hooks={"request": [attach_tracer]}, **kwargs)
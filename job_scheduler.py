@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""按预计耗时安排翻译任务的派发顺序，缩短整轮翻译的总耗时（makespan）
+
+最长任务优先（LPT）：耗时最长的任务最先开始，短任务填补其余空闲的并发名额，
+避免排在最后的大文件在其他名额都空闲时单独拖尾。LPT 的总耗时不超过最优解的 4/3。
+一个任务由若干分块组成，每个分块是一次 API 请求，同一任务的分块可以占用多个并发名额同时翻译。
+"""
+import heapq
+from typing import Dict, Hashable, List, Tuple
+
+
+def order_longest_first(chunk_costs: Dict[Hashable, List[float]]) -> List[Hashable]:
+    """按任务的总工作量从大到小排序，工作量相同的任务保持原有顺序"""
+    return sorted(chunk_costs, key=lambda job: -sum(chunk_costs[job]))
+
+
+def simulate_schedule(order: List[Hashable], chunk_costs: Dict[Hashable, List[float]],
+                      slots: int) -> Dict[Hashable, float]:
+    """模拟按 order 依次把每个分块派发到最先空闲的请求名额上，返回每个任务最后一个分块的预计完成时间"""
+    free_at = [0.0] * max(1, slots)
+    finish_times = {}
+    for job in order:
+        finish_times[job] = 0.0
+        for cost in chunk_costs[job]:
+            finish = heapq.heappop(free_at) + cost
+            heapq.heappush(free_at, finish)
+            finish_times[job] = max(finish_times[job], finish)
+    return finish_times
+
+
+def compare_schedule(chunk_costs: Dict[Hashable, List[float]], predicted: Dict[Hashable, float],
+                     finished: Dict[Hashable, float], request_seconds: float,
+                     slots: int) -> Tuple[float, Dict[str, float]]:
+    """把预计耗时换算为秒，返回换算系数和本轮总耗时的预计值、实际值与下限
+
+    换算系数为实际请求耗时总和与已完成任务的预计工作量之比。finished 为相对于本轮开始的秒数，只包含成功的任务。
+    下限取总工作量平均分到所有名额的耗时和最长分块的耗时中较大的一个。
+    """
+    finished_cost = sum(sum(chunk_costs[job]) for job in finished)
+    seconds_per_unit = request_seconds / finished_cost if finished_cost else 0.0
+    total_work = sum(sum(costs) for costs in chunk_costs.values()) * seconds_per_unit
+    longest_chunk = max((max(costs) for costs in chunk_costs.values() if costs), default=0.0) * seconds_per_unit
+    return seconds_per_unit, {
+        "predicted": max(predicted.values(), default=0.0) * seconds_per_unit,
+        "actual": max(finished.values(), default=0.0),
+        "ideal": max(total_work / max(1, slots), longest_chunk),
+    }
@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+"""本地的 OpenAI 兼容模拟服务，用于在不消耗 token、不联网的情况下对翻译流程做压测
+
+单独启动模拟服务：
+    python mock_llm_server.py --port 8000 --latency-median 1.5 --rate-429 0.05
+
+启动模拟服务并用合成的文章跑一遍 auto-translater-course.py：
+    python mock_llm_server.py --harness --files 200 --paragraphs 30 --langs ja ko -- --stream
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from token_estimator import estimate_tokens
+
+# 单语言请求的格式：Translate into {语言}:\n\n{原文}\n
+SINGLE_LANG_PATTERN = re.compile(r'^Translate into (.+?):\n\n(.*)\n$', re.DOTALL)
+# 多语言合并请求的格式：Translate into the following languages: ja (Japanese), ko (Korean)\n\n{原文}\n
+MULTI_LANG_PATTERN = re.compile(r'^Translate into the following languages: (.+?)\n\n(.*)\n$', re.DOTALL)
+PLACEHOLDER_LINE_PATTERN = re.compile(r'^\s*(\[to_be_replace\[[^\]]+\]\]\s*)+$')
+
+
+def pseudo_translate(text: str, lang: str) -> str:
+    """确定性的伪翻译：在每个正文行前加上语言标记，保留空行、代码围栏和占位词行"""
+    lines = []
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if not stripped or stripped.startswith(("```", "~~~")) or PLACEHOLDER_LINE_PATTERN.match(line):
+            lines.append(line)
+        else:
+            lines.append(f"[{lang}] {line}")
+    return "\n".join(lines)
+
+
+def percentile(values, percent):
+    """计算百分位数，values 为空时返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(math.ceil(percent / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class MockState:
+    """模拟服务的配置和统计信息，所有请求线程共享"""
+
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.random = random.Random(args.seed)
+        self.requests = 0
+        self.errors = {}
+        self.latencies = []
+        self.completion_tokens = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # 批量接口使用的文件和批量任务，全部保存在内存中
+        self.files = {}
+        self.batches = {}
+
+    def sample_latency(self) -> float:
+        """按对数正态分布抽样首个 token 的延迟"""
+        with self.lock:
+            return self.args.latency_median * math.exp(self.random.gauss(0, self.args.latency_sigma))
+
+    def sample_error(self):
+        """按配置的概率注入错误，返回要返回的状态码或 None"""
+        with self.lock:
+            roll = self.random.random()
+        for status, rate in ((429, self.args.rate_429), (500, self.args.rate_500), (503, self.args.rate_503)):
+            if roll < rate:
+                return status
+            roll -= rate
+        return None
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": dict(self.errors),
+                "completion_tokens": self.completion_tokens,
+                "max_in_flight": self.max_in_flight,
+                "latency_p50": percentile(self.latencies, 50),
+                "latency_p95": percentile(self.latencies, 95),
+                "latency_p99": percentile(self.latencies, 99),
+            }
+
+
+def build_reply(body: dict) -> str:
+    """根据请求内容生成伪翻译的回复，多语言合并请求返回以语言代码为键的 JSON，打包翻译的请求返回相同键的 JSON"""
+    user_content = body["messages"][-1]["content"]
+    multi_match = MULTI_LANG_PATTERN.match(user_content)
+    if multi_match:
+        langs = re.findall(r'([a-z]{2,3}) \(', multi_match.group(1))
+        return json.dumps({lang: pseudo_translate(multi_match.group(2), lang) for lang in langs},
+                          ensure_ascii=False)
+    single_match = SINGLE_LANG_PATTERN.match(user_content)
+    if single_match:
+        lang, text = single_match.group(1), single_match.group(2)
+        # 打包翻译的请求以 JSON 对象发送多段原文，逐个值翻译后按相同的键返回
+        if text.lstrip().startswith("{"):
+            try:
+                packed = json.loads(text)
+            except ValueError:
+                packed = None
+            if isinstance(packed, dict):
+                return json.dumps({key: pseudo_translate(str(value), lang) for key, value in packed.items()},
+                                  ensure_ascii=False)
+        return pseudo_translate(text, lang)
+    return pseudo_translate(user_content, "xx")
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        if self.state.args.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, data: dict, headers=None) -> None:
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path == "/stats":
+            self.send_json(200, self.state.snapshot())
+            return
+        content_match = re.search(r'/files/([^/]+)/content$', path)
+        if content_match and content_match.group(1) in self.state.files:
+            payload = self.state.files[content_match.group(1)]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        batch_match = re.search(r'/batches/([^/]+)$', path)
+        if batch_match and batch_match.group(1) in self.state.batches:
+            self.send_json(200, self.batch_view(self.state.batches[batch_match.group(1)]))
+            return
+        self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        raw_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.rstrip("/")
+        if path.endswith("/files"):
+            self.handle_file_upload(raw_body)
+        elif path.endswith("/batches"):
+            self.handle_batch_create(json.loads(raw_body))
+        elif path.endswith("/chat/completions"):
+            self.handle_chat_completion(json.loads(raw_body or b"{}"))
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def add_file(self, filename: str, purpose: str, content: bytes) -> dict:
+        with self.state.lock:
+            file_id = f"file-mock-{len(self.state.files) + 1}"
+            file_object = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                           "filename": filename, "purpose": purpose, "status": "processed"}
+            self.state.files[file_id] = dict(file_object, content=content)
+        return file_object
+
+    def handle_file_upload(self, raw_body: bytes) -> None:
+        """处理 multipart/form-data 格式的文件上传"""
+        message = BytesParser().parsebytes(
+            b"Content-Type: " + self.headers["Content-Type"].encode("utf-8") + b"\r\n\r\n" + raw_body)
+        fields = {}
+        filename = "upload.jsonl"
+        for part in message.get_payload():
+            name = part.get_param("name", header="content-disposition")
+            fields[name] = part.get_payload(decode=True)
+            if name == "file":
+                filename = part.get_filename() or filename
+        purpose = fields.get("purpose", b"batch").decode("utf-8")
+        self.send_json(200, self.add_file(filename, purpose, fields.get("file", b"")))
+
+    def handle_batch_create(self, body: dict) -> None:
+        """创建批量任务：立即生成所有请求的伪翻译结果，按 --batch-delay 延迟后才报告完成"""
+        state = self.state
+        input_file = state.files.get(body.get("input_file_id"))
+        if input_file is None:
+            self.send_json(404, {"error": {"message": "Unknown input_file_id"}})
+            return
+        output_lines = []
+        completed = failed = 0
+        for line in input_file["content"].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if state.sample_error() is not None:
+                failed += 1
+                response = {"status_code": 500, "request_id": "req-mock", "body": {"error": {"message": "Injected error"}}}
+            else:
+                completed += 1
+                reply = build_reply(item["body"])
+                prompt_tokens = sum(estimate_tokens(message["content"]) for message in item["body"]["messages"])
+                completion_tokens = estimate_tokens(reply)
+                response = {"status_code": 200, "request_id": "req-mock", "body": {
+                    "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+                    "model": item["body"].get("model", "mock"),
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": reply}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens}}}
+            output_lines.append(json.dumps({"id": "batch-req-mock", "custom_id": item["custom_id"],
+                                            "response": response, "error": None}, ensure_ascii=False))
+        output_file = self.add_file("batch_output.jsonl", "batch_output", ("\n".join(output_lines) + "\n").encode("utf-8"))
+        with state.lock:
+            batch_id = f"batch-mock-{len(state.batches) + 1}"
+            state.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": body.get("endpoint"),
+                "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window", "24h"),
+                "created_at": int(time.time()), "ready_at": time.monotonic() + state.args.batch_delay,
+                "output_file_id": output_file["id"],
+                "request_counts": {"total": completed + failed, "completed": completed, "failed": failed},
+            }
+        self.send_json(200, self.batch_view(state.batches[batch_id]))
+
+    def batch_view(self, batch: dict) -> dict:
+        """按创建时间和 --batch-delay 返回批量任务当前的状态"""
+        view = {key: value for key, value in batch.items() if key != "ready_at"}
+        if time.monotonic() < batch["ready_at"]:
+            view["status"] = "in_progress"
+            view["output_file_id"] = None
+            view["request_counts"] = dict(batch["request_counts"], completed=0, failed=0)
+        else:
+            view["status"] = "completed"
+        return view
+
+    def handle_chat_completion(self, body: dict) -> None:
+        state = self.state
+        with state.lock:
+            state.requests += 1
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+        start_time = time.monotonic()
+        try:
+            time.sleep(state.sample_latency())
+            error_status = state.sample_error()
+            if state.args.capacity and state.in_flight > state.args.capacity:
+                # 超过模拟的服务端容量时返回 429
+                error_status = 429
+            if error_status is not None:
+                with state.lock:
+                    state.errors[error_status] = state.errors.get(error_status, 0) + 1
+                headers = {"retry-after": str(state.args.retry_after)} if error_status == 429 else {}
+                self.send_json(error_status, {"error": {"message": f"Injected {error_status}", "type": "mock_error"}}, headers)
+                return
+
+            reply = build_reply(body)
+            prompt_tokens = sum(estimate_tokens(message["content"]) for message in body["messages"])
+            completion_tokens = estimate_tokens(reply)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            with state.lock:
+                state.completion_tokens += completion_tokens
+            if body.get("stream"):
+                self.stream_reply(body, reply, usage)
+            else:
+                # 非流式请求按输出速度等待整段输出生成完毕
+                if state.args.tokens_per_second:
+                    time.sleep(completion_tokens / state.args.tokens_per_second)
+                self.send_json(200, {
+                    "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": reply}}],
+                    "usage": usage,
+                })
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+                state.latencies.append(time.monotonic() - start_time)
+
+    def stream_reply(self, body: dict, reply: str, usage: dict) -> None:
+        """以 SSE 格式按输出速度逐段返回"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send_event(data):
+            self.wfile.write(b"data: " + json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+        base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model", "mock")}
+        piece_size = 32
+        for index in range(0, len(reply), piece_size):
+            piece = reply[index:index + piece_size]
+            if self.state.args.tokens_per_second:
+                time.sleep(estimate_tokens(piece) / self.state.args.tokens_per_second)
+            send_event(dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+        send_event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        send_event(dict(base, choices=[], usage=usage))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_server(args):
+    """在后台线程中启动模拟服务，返回 (server, state)"""
+    state = MockState(args)
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def generate_corpus(source_dir: str, files: int, paragraphs: int, seed: int) -> None:
+    """生成确定性的合成文章，包含 Front Matter、正文段落和带注释的代码块"""
+    rng = random.Random(seed)
+    words = ["区块链", "智能合约", "以太坊", "钱包", "交易", "共识", "节点", "质押", "代币", "网络"]
+    for file_index in range(files):
+        lines = [
+            "---",
+            f"title: 第 {file_index} 课",
+            f"description: 这是第 {file_index} 课的描述",
+            "---",
+            "",
+            f"# 第 {file_index} 课",
+        ]
+        for paragraph_index in range(paragraphs):
+            lines.append("")
+            if paragraph_index % 10 == 9:
+                lines.extend(["```solidity", "// 示例合约", "contract Demo {", "    uint value;", "}", "```"])
+            else:
+                sentence_count = rng.randint(2, 8)
+                lines.append("".join(f"{rng.choice(words)}是{rng.choice(words)}的一部分。"
+                                     for _ in range(sentence_count)))
+        sub_dir = os.path.join(source_dir, f"unit-{file_index // 50}")
+        os.makedirs(sub_dir, exist_ok=True)
+        with open(os.path.join(sub_dir, f"lesson-{file_index}.md"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def run_harness(args, translator_args) -> int:
+    """启动模拟服务，在临时目录中生成合成文章并运行翻译流程，最后输出吞吐量和延迟统计"""
+    server, state = start_server(args)
+    api_base = f"http://{args.host}:{server.server_address[1]}/v1"
+    work_dir = tempfile.mkdtemp(prefix="auto-i18n-bench-")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "auto-translater-course.py")
+    try:
+        generate_corpus(os.path.join(work_dir, "src"), args.files, args.paragraphs, args.seed)
+        command = [sys.executable, script, args.source] + args.langs + [
+            "--dir", "src", "--api-base", api_base, "--api-key", "mock", "--no-cache"] + translator_args
+        print(f"Running translator against {api_base} in {work_dir}")
+        sys.stdout.flush()
+        start_time = time.monotonic()
+        result = subprocess.run(command, cwd=work_dir,
+                                stdout=None if args.verbose else subprocess.DEVNULL)
+        elapsed = time.monotonic() - start_time
+
+        stats = state.snapshot()
+        print(f"Exit code:            {result.returncode}")
+        print(f"Wall time:            {elapsed:.2f}s")
+        print(f"Jobs (file x lang):   {args.files * len(args.langs)}")
+        print(f"Requests:             {stats['requests']} ({stats['requests'] / elapsed:.1f}/s)")
+        print(f"Injected errors:      {stats['errors']}")
+        print(f"Max in-flight:        {stats['max_in_flight']}")
+        print(f"Output tokens/s:      {stats['completion_tokens'] / elapsed:.0f}")
+        print(f"Latency p50/p95/p99:  {stats['latency_p50']:.2f}s / {stats['latency_p95']:.2f}s / {stats['latency_p99']:.2f}s")
+        return result.returncode
+    finally:
+        server.shutdown()
+        if args.keep:
+            print(f"Kept work directory: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地的 OpenAI 兼容模拟服务，用于离线压测翻译流程')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8000, help='监听端口，压测模式下为 0 表示随机端口')
+    parser.add_argument('--latency-median', type=float, default=1.0, help='首个 token 延迟的中位数（秒）')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='首个 token 延迟对数正态分布的 sigma')
+    parser.add_argument('--tokens-per-second', type=float, default=200, help='单个请求的输出速度，0 表示不限速')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='返回 429 的概率')
+    parser.add_argument('--rate-500', type=float, default=0.0, help='返回 500 的概率')
+    parser.add_argument('--rate-503', type=float, default=0.0, help='返回 503 的概率')
+    parser.add_argument('--capacity', type=int, default=0,
+                        help='模拟的服务端并发容量，同时进行中的请求超过该值时返回 429，0 表示不限制')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='429 响应中 Retry-After 的秒数')
+    parser.add_argument('--batch-delay', type=float, default=0.0, help='批量任务创建后多少秒才报告完成')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，保证延迟和错误注入可复现')
+    parser.add_argument('--verbose', action='store_true', help='输出请求日志和翻译程序的输出')
+    parser.add_argument('--harness', action='store_true', help='启动模拟服务并用合成文章运行一遍翻译流程')
+    parser.add_argument('--files', type=int, default=50, help='压测模式下生成的文章数')
+    parser.add_argument('--paragraphs', type=int, default=20, help='压测模式下每篇文章的段落数')
+    parser.add_argument('--source', default='zh', help='压测模式下的源语言')
+    parser.add_argument('--langs', nargs='+', default=['ja', 'ko'], help='压测模式下的目标语言')
+    parser.add_argument('--keep', action='store_true', help='压测结束后保留临时目录')
+
+    # "--" 之后的参数原样传给 auto-translater-course.py
+    argv = sys.argv[1:]
+    translator_args = []
+    if "--" in argv:
+        translator_args = argv[argv.index("--") + 1:]
+        argv = argv[:argv.index("--")]
+    args = parser.parse_args(argv)
+
+    if args.harness:
+        if "--port" not in argv:
+            args.port = 0
+        raise SystemExit(run_harness(args, translator_args))
+
+    server, _ = start_server(args)
+    print(f"Mock LLM server listening on http://{args.host}:{server.server_address[1]}/v1")
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
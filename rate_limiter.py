@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+
+class TokenBucketRateLimiter:
+    """全局令牌桶限流器，同时按每分钟请求数 (RPM) 和每分钟 token 数 (TPM) 计量
+
+    发送请求前按估算的 prompt + completion token 数扣减额度，收到响应后按实际用量修正。
+    rpm 或 tpm 为 None 时不限制对应的维度。
+    """
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        # 桶初始为满，允许启动时有一个突发
+        self.available_requests = float(rpm) if rpm else 0.0
+        self.available_tokens = float(tpm) if tpm else 0.0
+        self.updated_at = time.monotonic()
+        # 按到达顺序排队，避免大请求一直被小请求插队
+        self.lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        if self.rpm:
+            self.available_requests = min(self.rpm, self.available_requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.available_tokens = min(self.tpm, self.available_tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int) -> None:
+        """等待直到请求数和 token 数的额度都足够，然后扣减"""
+        if not self.rpm and not self.tpm:
+            return
+        # 单个请求的 token 数不能超过桶容量，否则永远等不到
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+        async with self.lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self.available_requests < 1:
+                    wait = max(wait, (1 - self.available_requests) * 60 / self.rpm)
+                if self.tpm and self.available_tokens < tokens:
+                    wait = max(wait, (tokens - self.available_tokens) * 60 / self.tpm)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.rpm:
+                self.available_requests -= 1
+            if self.tpm:
+                self.available_tokens -= tokens
+
+    def adjust(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """按响应中的实际 token 用量修正额度，多扣的退回，少扣的记为欠额"""
+        if self.tpm:
+            self.available_tokens = min(self.tpm, self.available_tokens + estimated_tokens - actual_tokens)
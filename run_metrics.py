@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """计算百分位数，values 为空时返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(-(-percent * len(ordered) // 100)) - 1))
+    return ordered[index]
+
+class RunMetrics:
+    """记录每次 API 调用的延迟、排队时间、token 用量、费用和重试次数
+
+    每条记录实时追加到本次运行的 JSONL 文件中，运行结束时输出 Prometheus 文本格式的指标文件和汇总表。
+    """
+
+    def __init__(self, metrics_dir: str):
+        if not os.path.exists(metrics_dir):
+            os.makedirs(metrics_dir)
+        self.metrics_dir = metrics_dir
+        self.jsonl_path = os.path.join(metrics_dir, time.strftime("run-%Y%m%d-%H%M%S.jsonl"))
+        self.jsonl_file = open(self.jsonl_path, "a", encoding="utf-8")
+        self.records = []
+        self.started_at = time.monotonic()
+
+    def record(self, **fields) -> None:
+        fields["timestamp"] = time.time()
+        self.records.append(fields)
+        self.jsonl_file.write(json.dumps(fields, ensure_ascii=False) + "\n")
+        self.jsonl_file.flush()
+
+    def write_prometheus(self, backends) -> str:
+        """按 node_exporter textfile 的格式写出本次运行的累计指标，backends 为本轮使用的后端，用于输出各后端的并发上限"""
+        lines = []
+        def add(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{value_}"' for key, value_ in sorted(labels.items()))
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        groups = {}
+        for record in self.records:
+            groups.setdefault((record["type"], record["lang"], record["status"]), []).append(record)
+        add("auto_i18n_requests_total", "counter", "API calls by prompt type, language and status",
+            [({"type": t, "lang": l, "status": st}, len(rs)) for (t, l, st), rs in groups.items()])
+        add("auto_i18n_retries_total", "counter", "Retried attempts by prompt type and language",
+            [({"type": t, "lang": l, "status": st}, sum(r["retries"] for r in rs)) for (t, l, st), rs in groups.items()])
+        for kind in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            add(f"auto_i18n_{kind}_total", "counter", f"Sum of {kind} reported by the API",
+                [({"type": t, "lang": l, "status": st}, sum(r[kind] for r in rs)) for (t, l, st), rs in groups.items()])
+        add("auto_i18n_cost_usd_total", "counter", "Estimated cost in USD",
+            [({"type": t, "lang": l, "status": st}, round(sum(r["cost"] for r in rs), 6)) for (t, l, st), rs in groups.items()])
+        latencies = [r["latency"] for r in self.records if r["status"] == "ok"]
+        queue_waits = [r["queue_wait"] for r in self.records]
+        add("auto_i18n_request_latency_seconds", "gauge", "Latency quantiles of successful API calls in this run",
+            [({"quantile": str(q)}, round(percentile(latencies, q * 100), 4)) for q in (0.5, 0.95, 0.99)])
+        add("auto_i18n_queue_wait_seconds", "gauge", "Queue wait quantiles before dispatch in this run",
+            [({"quantile": str(q)}, round(percentile(queue_waits, q * 100), 4)) for q in (0.5, 0.95, 0.99)])
+        pool_waits = [r.get("pool_wait", 0.0) for r in self.records]
+        add("auto_i18n_http_pool_wait_seconds", "gauge", "HTTP connection pool wait quantiles in this run",
+            [({"quantile": str(q)}, round(percentile(pool_waits, q * 100), 4)) for q in (0.5, 0.95, 0.99)])
+        add("auto_i18n_concurrency_limit", "gauge", "Adaptive concurrency limit per backend at the end of this run",
+            [({"backend": b.name}, b.concurrency_limiter.current_limit) for b in backends])
+        backend_groups = {}
+        for record in self.records:
+            backend_groups.setdefault((record["backend"], record["status"]), []).append(record)
+        add("auto_i18n_backend_requests_total", "counter", "API calls by backend and status",
+            [({"backend": b, "status": st}, len(rs)) for (b, st), rs in backend_groups.items()])
+        add("auto_i18n_http_new_connections_total", "counter", "API calls that had to open a new HTTP connection",
+            [({}, sum(1 for r in self.records if r.get("new_connection")))])
+
+        prom_path = os.path.join(self.metrics_dir, "auto_i18n.prom")
+        temp_path = prom_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, prom_path)
+        return prom_path
+
+    def summary(self) -> str:
+        """生成本次运行的汇总表：按语言统计请求数、延迟、token、费用和重试，使用了多个后端时再按后端统计"""
+        elapsed = time.monotonic() - self.started_at
+        rows = [("lang", "requests", "errors", "p50 s", "p95 s", "queue p95 s", "pool p95 s", "new conns",
+                 "limit", "tokens/s", "retries", "cost $")]
+        by_lang = {}
+        by_backend = {}
+        for record in self.records:
+            by_lang.setdefault(record["lang"], []).append(record)
+            by_backend.setdefault("backend:" + record["backend"], []).append(record)
+        groups = sorted(by_lang.items())
+        if len(by_backend) > 1:
+            groups += sorted(by_backend.items())
+        for lang, records in groups + [("TOTAL", self.records)]:
+            latencies = [r["latency"] for r in records if r["status"] == "ok"]
+            rows.append((
+                lang,
+                str(len(records)),
+                str(sum(1 for r in records if r["status"] != "ok")),
+                f"{percentile(latencies, 50):.2f}",
+                f"{percentile(latencies, 95):.2f}",
+                f"{percentile([r['queue_wait'] for r in records], 95):.2f}",
+                f"{percentile([r.get('pool_wait', 0.0) for r in records], 95):.2f}",
+                str(sum(1 for r in records if r.get("new_connection"))),
+                "{}-{}".format(min(r.get("concurrency_limit", 0) for r in records),
+                               max(r.get("concurrency_limit", 0) for r in records)),
+                f"{sum(r['completion_tokens'] for r in records) / elapsed:.0f}" if elapsed else "0",
+                str(sum(r["retries"] for r in records)),
+                f"{sum(r['cost'] for r in records):.4f}",
+            ))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+
+    def write_jobs(self, rows: List[Dict[str, Any]]) -> str:
+        """把本轮每个翻译任务的预计和实际完成时间写入与请求指标同名的 -jobs.jsonl 文件"""
+        jobs_path = self.jsonl_path[:-len(".jsonl")] + "-jobs.jsonl"
+        with open(jobs_path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        return jobs_path
+
+    def close(self) -> None:
+        self.jsonl_file.close()
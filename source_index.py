@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from typing import Callable, List, Tuple
+
+
+# 以这些前缀开头的目录或文件不需要翻译，扫描时整棵子树直接跳过
+SKIPPED_PATH_PREFIXES = ('Course Info', 'Unit Info', 'Lesson Info')
+
+def scan_source_tree(dir_to_translate: str):
+    """用 os.scandir 遍历源目录，按名称顺序返回 (文件路径, 相对路径, 文件名, stat)
+
+    scandir 在遍历时已经取得了文件类型，需要跳过的目录不会进入。
+    """
+    stack = [(dir_to_translate, "")]
+    while stack:
+        dir_path, relative_prefix = stack.pop()
+        with os.scandir(dir_path) as iterator:
+            entries = sorted(iterator, key=lambda entry: entry.name)
+        sub_dirs = []
+        for entry in entries:
+            name = entry.name
+            if name.startswith(SKIPPED_PATH_PREFIXES):
+                continue
+            # 与 os.walk 一样不进入指向目录的符号链接，避免链接成环或同一目录被扫描两次
+            if entry.is_dir(follow_symlinks=False):
+                sub_dirs.append((entry.path, relative_prefix + name + os.sep))
+            elif entry.is_file():
+                yield entry.path, relative_prefix + name, name, entry.stat()
+        # 子目录按名称顺序处理
+        stack.extend(reversed(sub_dirs))
+
+class SourceIndex:
+    """源文件索引，以相对路径为键记录文件的大小、修改时间、内容哈希、是否有强制翻译标识，以及已确认翻译过的语言
+
+    大小和修改时间都没有变化的文件直接使用索引中的哈希，不需要打开文件；已确认的语言不需要再查询翻译清单。
+    索引同时记录保存时翻译清单的大小和修改时间，翻译清单被修改或删除后，已确认的语言全部失效。
+    fingerprint 为 (文件路径, 相对路径, stat) 到 (源文件哈希, 是否强制翻译) 的函数，只对有变化的文件调用。
+    """
+
+    def __init__(self, path: str, manifest_path: str,
+                 fingerprint: Callable[[str, str, os.stat_result], Tuple[str, bool]]):
+        self.path = path
+        self.manifest_path = manifest_path
+        self.fingerprint = fingerprint
+        self.entries = {}
+        self.seen = {}
+        self.changed = False
+        manifest_stat = None
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.entries = data["files"]
+                manifest_stat = data["manifest"]
+            except (ValueError, KeyError, TypeError):
+                self.entries = {}
+        self.langs_valid = manifest_stat is not None and manifest_stat == self.get_manifest_stat()
+
+    def get_manifest_stat(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        stat = os.stat(self.manifest_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def lookup(self, input_file: str, relative_path: str, stat: os.stat_result):
+        """返回 (源文件哈希, 是否强制翻译, 已确认翻译过的语言列表)，文件有变化时重新读取"""
+        # 条目格式为 [大小, 修改时间, 是否强制翻译, 哈希, [已确认的语言]]
+        entry = self.entries.get(relative_path)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            self.seen[relative_path] = entry
+            return entry[3], entry[2], entry[4] if self.langs_valid else []
+        source_hash, force = self.fingerprint(input_file, relative_path, stat)
+        self.seen[relative_path] = [stat.st_size, stat.st_mtime_ns, force, source_hash, []]
+        self.changed = True
+        return source_hash, force, []
+
+    def mark_done(self, relative_path: str, langs: List[str]) -> None:
+        """记录文件已确认按当前内容翻译过的语言"""
+        entry = self.seen[relative_path]
+        old_langs = entry[4] if self.langs_valid else []
+        merged = sorted(set(old_langs) | set(langs))
+        if merged != entry[4]:
+            self.seen[relative_path] = entry[:4] + [merged]
+            self.changed = True
+
+    def start_scan(self, full: bool) -> None:
+        """开始新一轮扫描。全量扫描只保留本轮扫描到的文件，部分扫描（守护模式）在上一轮的基础上更新"""
+        if self.seen:
+            self.entries = self.seen
+        self.seen = {} if full else dict(self.entries)
+
+    def forget(self, relative_path: str) -> None:
+        if self.seen.pop(relative_path, None) is not None:
+            self.changed = True
+
+    def save(self) -> None:
+        """写回本次扫描到的文件（已删除的文件从索引中移除），并记录当前翻译清单的状态"""
+        manifest_stat = self.get_manifest_stat()
+        if not self.changed and len(self.seen) == len(self.entries) and self.langs_valid:
+            return
+        self.changed = False
+        self.langs_valid = True
+        index_dir = os.path.dirname(self.path)
+        if index_dir and not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"manifest": manifest_stat, "files": self.seen}, f, separators=(",", ":"))
+        os.replace(temp_path, self.path)
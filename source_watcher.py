@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from typing import Dict
+
+from source_index import SKIPPED_PATH_PREFIXES, scan_source_tree
+
+
+# inotify 事件掩码，见 <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+class SourceWatcher:
+    """监视源目录的文件变化
+
+    Linux 上通过 ctypes 调用 inotify，不需要额外的依赖；inotify 不可用时（其他平台、监视数量超出上限）
+    退回为定期比较文件的大小和修改时间。
+    """
+
+    def __init__(self, root: str, poll_interval: float):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.changed = set()
+        self.full_rescan = False
+        self.event = asyncio.Event()
+        self.watches = {}
+        self.fd = None
+        try:
+            self._start_inotify()
+        except (OSError, AttributeError) as e:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+            print(f"inotify is not available ({e}), polling every {poll_interval}s instead")
+            sys.stdout.flush()
+            self.snapshot = self._take_snapshot()
+        self.mode = "inotify" if self.fd is not None else "polling"
+
+    def _start_inotify(self) -> None:
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.fd = fd
+        self._add_tree("")
+        asyncio.get_running_loop().add_reader(fd, self._read_events)
+
+    def _add_tree(self, relative_dir: str) -> None:
+        """监视一个目录及其所有子目录（跳过不需要翻译的子目录），返回时新目录中已有的文件记为已变化"""
+        mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        dir_path = os.path.join(self.root, relative_dir) if relative_dir else self.root
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {dir_path}")
+        self.watches[wd] = relative_dir
+        with os.scandir(dir_path) as iterator:
+            for entry in iterator:
+                if entry.name.startswith(SKIPPED_PATH_PREFIXES):
+                    continue
+                relative_path = os.path.join(relative_dir, entry.name) if relative_dir else entry.name
+                # 与扫描源目录时一样不进入指向目录的符号链接
+                if entry.is_dir(follow_symlinks=False):
+                    self._add_tree(relative_path)
+
+    def _read_events(self) -> None:
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0"))
+                offset += INOTIFY_EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # 事件队列溢出，丢失的事件无法恢复，下一轮扫描整个源目录
+                    self.full_rescan = True
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                if wd not in self.watches or not name or name.startswith(SKIPPED_PATH_PREFIXES):
+                    continue
+                relative_dir = self.watches[wd]
+                relative_path = os.path.join(relative_dir, name) if relative_dir else name
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # 新目录中的文件可能在添加监视之前就已写入，这里直接全部记为已变化
+                        try:
+                            self._add_tree(relative_path)
+                        except OSError:
+                            self.full_rescan = True
+                        for _, file_path, _, _ in scan_source_tree(os.path.join(self.root, relative_path)):
+                            self.changed.add(os.path.join(relative_path, file_path))
+                    elif mask & IN_MOVED_FROM:
+                        self.full_rescan = True
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM):
+                    self.changed.add(relative_path)
+        if self.changed or self.full_rescan:
+            self.event.set()
+
+    def _take_snapshot(self) -> Dict[str, tuple]:
+        return {relative_path: (stat.st_size, stat.st_mtime_ns)
+                for _, relative_path, _, stat in scan_source_tree(self.root)}
+
+    def _poll(self) -> bool:
+        """轮询模式下比较两次扫描的结果，有变化时返回 True"""
+        snapshot = self._take_snapshot()
+        changed = {path for path, value in snapshot.items() if self.snapshot.get(path) != value}
+        changed |= set(self.snapshot) - set(snapshot)
+        self.snapshot = snapshot
+        self.changed |= changed
+        return bool(changed)
+
+    async def wait_for_changes(self, debounce: float):
+        """等待源文件变化，直到连续 debounce 秒没有新的变化后返回变化的相对路径集合；需要全量扫描时返回 None"""
+        while not (self.changed or self.full_rescan):
+            if self.fd is not None:
+                await self.event.wait()
+                self.event.clear()
+            else:
+                await asyncio.sleep(self.poll_interval)
+                self._poll()
+        # 防抖：编辑器保存时往往连续触发多个事件，等到一段时间内没有新事件再开始翻译
+        while True:
+            if self.fd is not None:
+                self.event.clear()
+                try:
+                    await asyncio.wait_for(self.event.wait(), debounce)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                await asyncio.sleep(debounce)
+                if not self._poll():
+                    break
+        changed, full_rescan = self.changed, self.full_rescan
+        self.changed, self.full_rescan = set(), False
+        return None if full_rescan else changed
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 辅助模块都放在仓库根目录，测试时从根目录导入
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def course():
+    """按文件路径加载 auto-translater-course.py（文件名带连字符，不能直接 import）"""
+    spec = importlib.util.spec_from_file_location("auto_translater_course",
+                                                  os.path.join(ROOT, "auto-translater-course.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import datetime
+
+
+def test_non_string_values_are_kept(course, monkeypatch):
+    requested = []
+
+    async def fake_translate_text(text, lang, type, models_used=None):
+        requested.append(text)
+        return f"[{lang}] {text}"
+
+    monkeypatch.setattr(course, "translate_text", fake_translate_text)
+    front_matter = {"title": 2024, "description": "课程简介", "date": datetime.date(2024, 1, 1)}
+    result = asyncio.run(course.translate_front_matter(front_matter, "ja"))
+    assert result == {"title": 2024, "description": "[ja] 课程简介", "date": datetime.date(2024, 1, 1)}
+    assert requested == ["课程简介"]
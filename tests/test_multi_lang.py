@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+
+def test_shared_request_is_released_after_all_languages(course, monkeypatch):
+    calls = []
+
+    async def fake_request(text, type):
+        calls.append(text)
+        return {"ja": f"[ja] {text}", "ko": f"[ko] {text}"}, "mock-model"
+
+    monkeypatch.setattr(course, "request_multi_lang_translation", fake_request)
+    monkeypatch.setattr(course, "multi_lang_targets", ["ja", "ko"])
+    monkeypatch.setattr(course, "translation_cache", None)
+    monkeypatch.setattr(course, "multi_lang_requests", {})
+
+    async def translate_all():
+        ja = await course.translate_text_multi_lang("段落", "ja", "main-body")
+        assert course.multi_lang_requests
+        ko = await course.translate_text_multi_lang("段落", "ko", "main-body")
+        return ja, ko
+
+    assert asyncio.run(translate_all()) == (("[ja] 段落", "mock-model"), ("[ko] 段落", "mock-model"))
+    assert calls == ["段落"]
+    assert course.multi_lang_requests == {}
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from replace_engine import ReplaceEngine
+
+
+def test_longest_rule_wins():
+    engine = ReplaceEngine({"智能": "[1]", "智能合约": "[2]", "合约": "[3]"})
+    assert engine.replace("智能合约和智能钱包的合约") == "[2]和[1]钱包的[3]"
+
+
+def test_very_long_rule():
+    footer = "本课程内容遵循 CC BY-NC-SA 4.0 许可协议，转载请注明出处。" * 40
+    assert len(footer) > 1000
+    engine = ReplaceEngine({footer: "[footer]", footer[:500]: "[head]", "课程": "[course]"})
+    text = "正文\n\n" + footer + "\n\n" + footer[:500] + "课程"
+    assert engine.replace(text) == "正文\n\n[footer]\n\n[head][course]"
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import os
+
+from source_index import scan_source_tree
+
+
+def write(path, text="# title\n"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def scan(root):
+    return [relative_path for _, relative_path, _, _ in scan_source_tree(str(root))]
+
+
+def test_scan_skips_prefixed_subtrees(tmp_path):
+    write(tmp_path / "a" / "lesson.md")
+    write(tmp_path / "Lesson Info" / "info.md")
+    write(tmp_path / "b" / "Unit Info.md")
+    assert scan(tmp_path) == [os.path.join("a", "lesson.md")]
+
+
+def test_scan_does_not_follow_directory_symlinks(tmp_path):
+    write(tmp_path / "a" / "lesson.md")
+    # 指向上级目录的链接成环，os.walk 默认不会进入
+    os.symlink("..", tmp_path / "a" / "loop")
+    # 指向已有目录的链接，进入的话同一篇文章会被翻译两次
+    os.symlink("a", tmp_path / "alias")
+    assert scan(tmp_path) == [os.path.join("a", "lesson.md")]
+
+
+def test_scan_keeps_file_symlinks(tmp_path):
+    write(tmp_path / "a" / "lesson.md")
+    os.symlink("lesson.md", tmp_path / "a" / "copy.md")
+    assert scan(tmp_path) == [os.path.join("a", "copy.md"), os.path.join("a", "lesson.md")]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+
+from source_watcher import SourceWatcher
+
+
+def test_watcher_does_not_follow_directory_symlinks(tmp_path):
+    os.makedirs(tmp_path / "a" / "b")
+    os.symlink("..", tmp_path / "a" / "loop")
+
+    async def watched_dirs():
+        watcher = SourceWatcher(str(tmp_path), 1.0)
+        if watcher.fd is not None:
+            asyncio.get_running_loop().remove_reader(watcher.fd)
+            os.close(watcher.fd)
+        return sorted(watcher.watches.values())
+
+    dirs = asyncio.run(watched_dirs())
+    # 不支持 inotify 的平台退回为轮询，不会添加监视
+    assert dirs in ([], ["", "a", os.path.join("a", "b")])
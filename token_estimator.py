@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import re
+
+# 中日韩文字及全角标点，大约每个字符对应一个 token
+CJK_PATTERN = re.compile(
+    '[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+
+def estimate_tokens(text: str) -> int:
+    """在本地粗略估算文本的 token 数，不依赖网络和分词器
+
+    中日韩字符按每个字符一个 token 计算，其余字符按每四个字符一个 token 计算。
+    """
+    if not text:
+        return 0
+    cjk_count = len(CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+def chunk_token_budget(context_tokens: int, max_output_tokens: int, prompt_tokens: int,
+                       output_ratio: float, output_count: int = 1) -> int:
+    """计算单个分块最多可以容纳的原文 token 数
+
+    上下文窗口需要同时容纳提示词、原文和译文；译文按原文 token 数乘以 output_ratio 估算，
+    一次请求输出多种语言时乘以 output_count。同时译文不能超过模型的最大输出 token 数。
+    """
+    output_per_token = output_ratio * output_count
+    by_context = (context_tokens - prompt_tokens) / (1 + output_per_token)
+    by_output = max_output_tokens / output_per_token
+    return max(1, int(min(by_context, by_output)))
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+def make_cache_key(text: str, lang: str, model: str, system_prompt: str) -> str:
+    """根据原文、目标语言、模型和系统提示词计算缓存键"""
+    payload = json.dumps([text, lang, model, system_prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    """基于内容寻址的本地翻译缓存，使用 SQLite 持久化，超出容量时按最近最少使用淘汰"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM translations").fetchone()[0]
+
+    def get(self, key: str):
+        """查询缓存，命中时返回译文并刷新访问时间，未命中返回 None"""
+        row = self.conn.execute(
+            "SELECT value FROM translations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute(
+            "UPDATE translations SET last_access = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        return row[0]
+
+    def get_any(self, keys):
+        """按顺序查询多个缓存键，返回第一个命中的 (键, 译文)，都未命中返回 None。整次查询只计一次命中或未命中"""
+        for key in keys:
+            row = self.conn.execute(
+                "SELECT value FROM translations WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.hits += 1
+                self.conn.execute(
+                    "UPDATE translations SET last_access = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+                return key, row[0]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: str) -> None:
+        """写入缓存，写入后如超出容量则淘汰最久未访问的条目"""
+        size = len(value.encode("utf-8"))
+        old = self.conn.execute(
+            "SELECT size FROM translations WHERE key = ?", (key,)).fetchone()
+        if old is not None:
+            self.total_bytes -= old[0]
+        self.conn.execute(
+            "INSERT OR REPLACE INTO translations (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, value, size, time.time()))
+        self.total_bytes += size
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+        self.conn.commit()
+
+    def _evict(self) -> None:
+        # 淘汰到容量的 90%，避免每次写入都触发淘汰
+        target = int(self.max_bytes * 0.9)
+        rows = self.conn.execute(
+            "SELECT key, size FROM translations ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            self.conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> str:
+        """返回缓存命中统计信息"""
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        return (f"Translation cache: {self.hits} hits, {self.misses} misses "
+                f"({hit_rate:.1f}% hit rate), {self.evictions} evictions, "
+                f"{self.total_bytes / 1024 / 1024:.1f} MiB stored")
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import sys
+import time
+from typing import Callable
+
+
+class TranslationManifest:
+    """翻译清单，以 (相对路径, 语言) 为键记录源文件哈希、译文哈希、模型和翻译时间
+
+    清单在第一次使用时一次性读入内存（源文件索引已确认所有文件都无需翻译时不会读取），
+    翻译过程中的更新累积到一定数量后批量写回磁盘。旧版的 processed_list.txt 会在首次运行时自动迁移。
+    get_output_file 为 (相对路径, 语言) 到输出文件路径的函数，用于判断旧版清单中的文件是否已经有译文。
+    """
+
+    def __init__(self, path: str, legacy_list_path: str, flush_every: int,
+                 get_output_file: Callable[[str, str], str]):
+        self.path = path
+        self.legacy_list_path = legacy_list_path
+        self.flush_every = flush_every
+        self.get_output_file = get_output_file
+        self.entries = None
+        self.legacy_paths = set()
+        self.pending_updates = 0
+
+    def _load(self) -> None:
+        if self.entries is not None:
+            return
+        self.entries = {}
+        path, legacy_list_path = self.path, self.legacy_list_path
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)["entries"]
+        elif os.path.exists(legacy_list_path):
+            # 旧版清单只记录了文件名，视为所有语言都已翻译过
+            with open(legacy_list_path, "r", encoding="utf-8") as f:
+                self.legacy_paths = set(line for line in f.read().splitlines() if line)
+            print(f"Migrating {len(self.legacy_paths)} entries from {legacy_list_path} to {path}")
+            sys.stdout.flush()
+
+    def is_up_to_date(self, relative_path: str, lang: str, source_hash: str) -> bool:
+        """判断文件在该语言下是否已经按当前源文件内容翻译过"""
+        self._load()
+        entry = self.entries.get(relative_path, {}).get(lang)
+        if entry is None:
+            # 旧版清单中的文件，如果输出文件存在，则以当前源文件内容作为基准
+            if relative_path in self.legacy_paths and os.path.exists(self.get_output_file(relative_path, lang)):
+                self.record(relative_path, lang, source_hash, None, None)
+                return True
+            return False
+        return entry["source_hash"] == source_hash
+
+    def record(self, relative_path: str, lang: str, source_hash: str, output_hash, model) -> None:
+        """记录一次翻译结果，累积到一定数量后写回磁盘"""
+        self._load()
+        self.entries.setdefault(relative_path, {})[lang] = {
+            "source_hash": source_hash,
+            "output_hash": output_hash,
+            "model": model,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+        self.pending_updates += 1
+        if self.pending_updates >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """将清单写回磁盘，先写临时文件再替换，避免中断时损坏清单"""
+        if self.pending_updates == 0 and os.path.exists(self.path):
+            return
+        self._load()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": self.entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self.pending_updates = 0